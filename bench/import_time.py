@@ -0,0 +1,114 @@
+"""
+Benchmark studeného startu skriptů — co stojí samotný `import`.
+
+Každý skript se naimportuje v čistém interpretu s `-X importtime`
+a vypíše se celkový čas, nejdražší přímé importy a případné těžké
+závislosti, které se mají načítat až v main() (gspread, BigQuery,
+selenium, requests…). Ty jsou chyba vždy; čas jen při `--budget-ms`.
+
+Použití (z kořene repozitáře):
+    python bench/import_time.py
+    python bench/import_time.py --budget-ms 600 --raw-dir importtime/
+    python bench/import_time.py --only pagespeed --top 10
+
+Návratový kód 1 = regrese (zakázaný import nebo překročený rozpočet).
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# název → (adresář, modul, závislosti, které se při importu načíst nesmí)
+SCRIPTS = {
+    "strava":    ("strava", "stravaDownloader", ["gspread", "google.auth", "google.oauth2", "requests"]),
+    "pagespeed": ("pagespeed", "pagespeedInsightsAPI", ["google.cloud", "gspread", "google.auth", "requests"]),
+    "gpx":       ("gpx-mapper", "gpx_map", ["gpxpy", "requests"]),
+    "instagram": ("instagram", "instagramDownloader", ["selenium", "webdriver_manager", "requests", "pandas"]),
+}
+
+
+def measure(directory: str, module: str) -> tuple[str, str]:
+    """Spustí import v novém procesu; vrací (výstup -X importtime, chyba)."""
+    code = f"import sys; sys.path.insert(0, {str(ROOT / directory)!r}); import {module}"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, cwd=ROOT)
+    lines = [l for l in proc.stderr.splitlines() if l.startswith("import time:")]
+    error = "" if proc.returncode == 0 else proc.stderr.strip().splitlines()[-1]
+    return "\n".join(lines), error
+
+
+def parse(report: str) -> list[tuple[int, int, int, str]]:
+    """Řádky `import time: self | cumulative | name` → (hloubka, self µs, cumul µs, modul)."""
+    entries = []
+    for line in report.splitlines():
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue   # hlavička
+        self_us, cumulative_us, raw = parts
+        depth = (len(raw) - len(raw.lstrip(" ")) - 1) // 2
+        entries.append((depth, int(self_us), int(cumulative_us), raw.strip()))
+    return entries
+
+
+def summarize(entries, module, forbidden, top):
+    names = {name for _, _, _, name in entries}
+    total_us = sum(cumulative for depth, _, cumulative, _ in entries if depth == 0)
+    own = next((cumulative for depth, _, cumulative, name in entries if depth == 0 and name == module), 0)
+    # Přímé importy skriptu = hloubka 1 pod jeho záznamem (ten je v logu až za nimi)
+    direct, children = [], []
+    for depth, _, cumulative, name in entries:
+        if depth == 1:
+            children.append((cumulative, name))
+        elif depth == 0:
+            if name == module:
+                direct = children
+            children = []
+    loaded = sorted(f for f in forbidden if any(n == f or n.startswith(f + ".") for n in names))
+    return {
+        "total_ms": total_us / 1000,
+        "module_ms": own / 1000,
+        "heaviest": sorted(direct, reverse=True)[:top],
+        "forbidden": loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Čas importu skriptů (-X importtime)")
+    parser.add_argument("--only", nargs="+", choices=sorted(SCRIPTS), help="Jen vybrané skripty")
+    parser.add_argument("--budget-ms", type=float, help="Selhat, pokud import skriptu trvá déle")
+    parser.add_argument("--top", type=int, default=5, help="Počet nejdražších přímých importů")
+    parser.add_argument("--raw-dir", help="Uložit surový výstup -X importtime do této složky")
+    args = parser.parse_args()
+
+    failed = False
+    for key in args.only or SCRIPTS:
+        directory, module, forbidden = SCRIPTS[key]
+        report, error = measure(directory, module)
+        if args.raw_dir:
+            Path(args.raw_dir).mkdir(parents=True, exist_ok=True)
+            (Path(args.raw_dir) / f"{key}.txt").write_text(report + "\n", encoding="utf-8")
+        if error:
+            print(f"✗ {key:<10} import selhal: {error}")
+            failed = True
+            continue
+
+        result = summarize(parse(report), module, forbidden, args.top)
+        over_budget = args.budget_ms is not None and result["module_ms"] > args.budget_ms
+        ok = not result["forbidden"] and not over_budget
+        failed |= not ok
+        print(f"{'✓' if ok else '✗'} {key:<10} {result['module_ms']:8.1f} ms "
+              f"(celý interpret {result['total_ms']:.1f} ms)"
+              f"{f' — nad rozpočtem {args.budget_ms:.0f} ms' if over_budget else ''}")
+        for cumulative, name in result["heaviest"]:
+            print(f"      {cumulative / 1000:8.1f} ms  {name}")
+        if result["forbidden"]:
+            print(f"      ✗ při importu se načítá: {', '.join(result['forbidden'])}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,30 @@
 #!/usr/bin/env python3
 """
-Render GPX tracks as a heatmap — overlapping routes glow brighter.
+Render GPX tracks (or binary .trk tracks from strava/track_export.py)
+as a heatmap — overlapping routes glow brighter.
 
 Usage:
     python gpx_map.py maps/*.gpx -o output.png
     python gpx_map.py maps/*.gpx -o output.png --width 4096 --padding 60
+    python gpx_map.py maps/*.gpx -o output.webp --quality 85
 """
 
 import argparse
 import math
+import os
+import struct
 import sys
+import zlib
 from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
 
-import gpxpy
 import numpy as np
-import requests
 from PIL import Image, ImageDraw, ImageFilter
 
+# gpxpy (only for .gpx inputs) and requests (only when tiles miss the cache)
+# are imported inside the functions that use them.
+
 TILE_URL = "https://a.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png"
 TILE_SIZE = 256
 HEADERS = {"User-Agent": "gpx-heatmap/1.0"}
@@ -49,19 +55,24 @@ def point_to_px(lat, lng, zoom, origin_tx, origin_ty):
 # ── Tile download ──────────────────────────────────────────────────────────────
 
 def fetch_tile(args):
+    import requests
+
     tx, ty, zoom = args
     url = TILE_URL.format(x=tx, y=ty, z=zoom)
     try:
         r = requests.get(url, headers=HEADERS, timeout=15)
         r.raise_for_status()
-        return tx, ty, Image.open(BytesIO(r.content)).convert("RGB")
+        return tx, ty, Image.open(BytesIO(r.content)).convert("RGB"), True
     except Exception as e:
         print(f"  Warning: tile {tx},{ty}@{zoom} failed: {e}", file=sys.stderr)
-        return tx, ty, Image.new("RGB", (TILE_SIZE, TILE_SIZE), (20, 20, 20))
+        return tx, ty, Image.new("RGB", (TILE_SIZE, TILE_SIZE), (20, 20, 20)), False
 
 
 def build_background(zoom, origin_tx, origin_ty, width, height):
-    """Download only tiles visible in the output (center-based, not bbox-based)."""
+    """Download only tiles visible in the output (center-based, not bbox-based).
+
+    Returns (canvas, failed) where failed is the number of placeholder tiles.
+    """
     tx_min = int(origin_tx)
     ty_min = int(origin_ty)
     tx_max = int(origin_tx + width / TILE_SIZE) + 1
@@ -71,21 +82,85 @@ def build_background(zoom, origin_tx, origin_ty, width, height):
     total = len(jobs)
     print(f"  Downloading {total} map tiles...")
 
-    canvas = Image.new("RGB", ((tx_max - tx_min + 1) * TILE_SIZE, (ty_max - ty_min + 1) * TILE_SIZE))
+    # Paste straight into the output-sized canvas, shifted by the fractional
+    # tile origin, so there is no oversized canvas to crop (and copy) later.
+    offset_x = int((origin_tx - tx_min) * TILE_SIZE)
+    offset_y = int((origin_ty - ty_min) * TILE_SIZE)
+    canvas = Image.new("RGB", (width, height))
+    failed = 0
 
     with ThreadPoolExecutor(max_workers=8) as ex:
-        for i, (tx, ty, tile) in enumerate(ex.map(fetch_tile, jobs), 1):
-            px = (tx - tx_min) * TILE_SIZE
-            py = (ty - ty_min) * TILE_SIZE
+        for i, (tx, ty, tile, ok) in enumerate(ex.map(fetch_tile, jobs), 1):
+            px = (tx - tx_min) * TILE_SIZE - offset_x
+            py = (ty - ty_min) * TILE_SIZE - offset_y
             canvas.paste(tile, (px, py))
+            failed += not ok
             print(f"  Tiles: {i}/{total}", end="\r")
 
     print()
+    return canvas, failed
 
-    # Crop to exact output size aligned to fractional tile origin
-    offset_x = int((origin_tx - tx_min) * TILE_SIZE)
-    offset_y = int((origin_ty - ty_min) * TILE_SIZE)
-    return canvas.crop((offset_x, offset_y, offset_x + width, offset_y + height))
+
+# ── Background cache ───────────────────────────────────────────────────────────
+#
+# Stitched backgrounds are stored as raw RGB bytes (H×W×3, no header) so a
+# re-render of the same viewport maps the file instead of decoding tiles.
+
+def _bg_cache_path(cache_dir, zoom, origin_tx, origin_ty, width, height):
+    return cache_dir / f"bg_z{zoom}_{origin_tx:.6f}_{origin_ty:.6f}_{width}x{height}.rgb"
+
+
+def load_cached_background(cache_dir, zoom, origin_tx, origin_ty, width, height):
+    """Return a zero-copy memory-mapped background, or None on cache miss."""
+    path = _bg_cache_path(cache_dir, zoom, origin_tx, origin_ty, width, height)
+    if not path.exists() or path.stat().st_size != width * height * 3:
+        return None
+    data = np.memmap(path, dtype=np.uint8, mode="r", shape=(height, width, 3))
+    path.touch()  # mtime doubles as LRU timestamp for eviction
+    return Image.frombuffer("RGB", (width, height), data, "raw", "RGB", 0, 1)
+
+
+def store_cached_background(cache_dir, bg, zoom, origin_tx, origin_ty, max_bytes):
+    """Write the background as raw RGB, then evict least recently used entries."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = _bg_cache_path(cache_dir, zoom, origin_tx, origin_ty, bg.width, bg.height)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(bg.tobytes())
+    tmp.replace(path)
+    evict_background_cache(cache_dir, max_bytes, keep=path)
+
+
+def evict_background_cache(cache_dir, max_bytes, keep=None):
+    entries = sorted(cache_dir.glob("bg_*.rgb"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in entries)
+    for p in entries:
+        if total <= max_bytes:
+            break
+        if p == keep:
+            continue
+        total -= p.stat().st_size
+        p.unlink(missing_ok=True)
+
+
+def get_background(zoom, origin_tx, origin_ty, width, height, cache_dir=None, cache_max_mb=512):
+    if cache_dir is None:
+        return build_background(zoom, origin_tx, origin_ty, width, height)[0]
+
+    bg = load_cached_background(cache_dir, zoom, origin_tx, origin_ty, width, height)
+    if bg is not None:
+        print("  Background loaded from cache.")
+        return bg
+
+    bg, failed = build_background(zoom, origin_tx, origin_ty, width, height)
+    if failed:
+        # Placeholder tiles would stick in the cache for every later render
+        print(f"  Warning: {failed} tile(s) failed, background not cached.", file=sys.stderr)
+        return bg
+    try:
+        store_cached_background(cache_dir, bg, zoom, origin_tx, origin_ty, cache_max_mb * 1024 * 1024)
+    except OSError as e:
+        print(f"  Warning: background cache write failed: {e}", file=sys.stderr)
+    return bg
 
 
 # ── GPX parsing ────────────────────────────────────────────────────────────────
@@ -97,7 +172,28 @@ def detect_color(filename):
     return "red"
 
 
+def parse_trk(path):
+    """Read a binary .trk track written by strava/track_export.py.
+
+    Layout (little-endian): b"GTRK", u8 version, u8 flags, u32 count,
+    then count × i32 latitude and count × i32 longitude in 1e-7 degrees
+    (optional time/altitude arrays follow and are ignored here).
+    """
+    data = path.read_bytes()
+    if data[:4] != b"GTRK" or data[4] != 1:
+        raise ValueError("not a GTRK v1 track")
+    n = int.from_bytes(data[6:10], "little")
+    coords = np.frombuffer(data, dtype="<i4", count=2 * n, offset=10).reshape(2, n) / 1e7
+    return [list(zip(coords[0].tolist(), coords[1].tolist()))] if n else []
+
+
+def parse_track(path):
+    return parse_trk(path) if path.suffix == ".trk" else parse_gpx(path)
+
+
 def parse_gpx(path):
+    import gpxpy
+
     with open(path, encoding="utf-8") as f:
         gpx = gpxpy.parse(f)
 
@@ -169,6 +265,122 @@ def colorize(acc, color):
     return Image.fromarray(rgb, "RGB")
 
 
+# ── Output encoding ────────────────────────────────────────────────────────────
+
+OUTPUT_FORMATS = {
+    ".png": "png",
+    ".webp": "webp",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".tif": "tiff",
+    ".tiff": "tiff",
+}
+
+
+class StreamingPNGWriter:
+    """Write an RGB PNG band by band, deflating bands in parallel.
+
+    Each band is filtered (Sub) and compressed independently with a sync
+    flush, so the raw-deflate pieces concatenate into one valid zlib stream.
+    zlib releases the GIL, so a thread pool scales across cores; the rows
+    never have to exist in memory all at once.
+    """
+
+    def __init__(self, path, width, height, compress_level=6, workers=None):
+        self.width = width
+        self.height = height
+        self.compress_level = compress_level
+        self.rows_written = 0
+        self._adler = 1
+        self._pending = []
+        self._workers = workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=self._workers)
+        self._f = open(path, "wb")
+        self._f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        self._zlib_header_written = False
+
+    def _chunk(self, tag, data):
+        self._f.write(struct.pack(">I", len(data)))
+        self._f.write(tag)
+        self._f.write(data)
+        self._f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag))))
+
+    def _deflate(self, raw, last):
+        co = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+        return co.compress(raw) + co.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def write_rows(self, rows):
+        """Queue an (n, width, 3) uint8 band for compression."""
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), self.width * 3)
+        filtered = np.empty((len(rows), self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 1  # filter type: Sub
+        filtered[:, 1:4] = rows[:, :3]
+        np.subtract(rows[:, 3:], rows[:, :-3], out=filtered[:, 4:])
+        raw = filtered.tobytes()
+        self._adler = zlib.adler32(raw, self._adler)
+        self.rows_written += len(rows)
+        last = self.rows_written >= self.height
+        self._pending.append(self._pool.submit(self._deflate, raw, last))
+        # Keep a bounded number of bands in flight
+        while len(self._pending) > 2 * self._workers:
+            self._flush_one()
+
+    def _flush_one(self):
+        data = self._pending.pop(0).result()
+        if not self._zlib_header_written:
+            data = b"\x78\x01" + data
+            self._zlib_header_written = True
+        self._chunk(b"IDAT", data)
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG expects {self.height} rows, got {self.rows_written}")
+        while self._pending:
+            self._flush_one()
+        self._chunk(b"IDAT", struct.pack(">I", self._adler & 0xFFFFFFFF))
+        self._chunk(b"IEND", b"")
+        self._pool.shutdown()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(cancel_futures=True)
+            self._f.close()
+
+
+def resolve_format(output, fmt=None):
+    if fmt:
+        return fmt
+    return OUTPUT_FORMATS.get(output.suffix.lower(), "png")
+
+
+def save_output(img, output, fmt, quality=90, compress_level=6, workers=None, band_rows=256):
+    """Encode the final RGBA composite to disk in the requested format."""
+    if fmt == "png":
+        with StreamingPNGWriter(output, img.width, img.height, compress_level, workers) as w:
+            for y in range(0, img.height, band_rows):
+                band = img.crop((0, y, img.width, min(y + band_rows, img.height))).convert("RGB")
+                w.write_rows(np.asarray(band))
+        return
+
+    rgb = img.convert("RGB")
+    if fmt == "jpeg":
+        rgb.save(output, "JPEG", quality=quality, optimize=False, subsampling=0 if quality >= 90 else 2)
+    elif fmt == "webp":
+        # method 0-6 trades speed for size; map compress level onto it
+        rgb.save(output, "WEBP", quality=quality, method=min(6, max(0, round(compress_level * 6 / 9))))
+    elif fmt == "tiff":
+        rgb.save(output, "TIFF", compression="tiff_adobe_deflate" if compress_level > 0 else None)
+    else:
+        raise ValueError(f"Unknown output format: {fmt}")
+
+
 # ── Main ───────────────────────────────────────────────────────────────────────
 
 def main():
@@ -185,6 +397,18 @@ def main():
                         help="Override color for all tracks")
     parser.add_argument("--zoom", type=int, help="Force zoom level")
     parser.add_argument("--min-zoom", type=int, default=12, help="Minimum auto-zoom level (default: 12)")
+    parser.add_argument("--cache-dir", type=Path, default=Path("cache"),
+                        help="Directory for cached map backgrounds (default: ./cache/)")
+    parser.add_argument("--cache-max-mb", type=int, default=512,
+                        help="Background cache size limit in MB (default: 512)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the background cache")
+    parser.add_argument("--format", choices=["png", "webp", "jpeg", "tiff"], default=None,
+                        help="Output format (default: from --output extension)")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG/WebP quality 1-100 (default: 90)")
+    parser.add_argument("--compress-level", type=int, default=6, choices=range(10), metavar="0-9",
+                        help="PNG/TIFF deflate level, WebP effort (default: 6, 1 = fast)")
+    parser.add_argument("--encode-workers", type=int, default=None,
+                        help="Threads for PNG encoding (default: CPU count)")
     args = parser.parse_args()
 
     # Resolve input files — expand directories, default to ./maps/
@@ -192,8 +416,8 @@ def main():
     gpx_files = []
     for p in inputs:
         if p.is_dir():
-            found = sorted(p.glob("**/*.gpx"))
-            print(f"Found {len(found)} GPX file(s) in {p}/")
+            found = sorted(p.glob("**/*.gpx")) + sorted(p.glob("**/*.trk"))
+            print(f"Found {len(found)} track file(s) in {p}/")
             gpx_files.extend(found)
         else:
             gpx_files.append(p)
@@ -211,7 +435,7 @@ def main():
             continue
         color = args.color or detect_color(path.name)
         try:
-            segs = parse_gpx(path)
+            segs = parse_track(path)
             for seg in segs:
                 all_segments.append((color, seg))
             print(f"  {path.name}: {len(segs)} segment(s), color={color}")
@@ -250,7 +474,9 @@ def main():
     origin_ty = lat_to_ty(center_lat, zoom) - args.height / (2 * TILE_SIZE)
 
     # Build background (exactly width×height)
-    bg = build_background(zoom, origin_tx, origin_ty, args.width, args.height)
+    bg = get_background(zoom, origin_tx, origin_ty, args.width, args.height,
+                        cache_dir=None if args.no_cache else args.cache_dir,
+                        cache_max_mb=args.cache_max_mb)
     W, H = bg.size  # == args.width, args.height
 
     # Accumulator per color channel
@@ -296,8 +522,10 @@ def main():
         result.paste(heatmap, (0, 0), alpha_img)
 
     args.output.parent.mkdir(parents=True, exist_ok=True)
-    result.convert("RGB").save(args.output)
-    print(f"Saved to {args.output}  ({result.width}×{result.height}px)")
+    fmt = resolve_format(args.output, args.format)
+    save_output(result, args.output, fmt, quality=args.quality,
+                compress_level=args.compress_level, workers=args.encode_workers)
+    print(f"Saved to {args.output}  ({result.width}×{result.height}px, {fmt})")
 
 
 if __name__ == "__main__":
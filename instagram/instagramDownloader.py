@@ -1,58 +1,67 @@
 # 📚 Import knihoven
 import os
-import time
-import requests
+import sys
+import json
+import queue
+import shutil
+import struct
+import zlib
+import hashlib
+import tempfile
+import threading
 import zipfile
 import datetime
-from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import pandas as pd
-
-try:
-    from google.colab import files as colab_files
-    IN_COLAB = True
-except ImportError:
-    IN_COLAB = False
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from url_source import CsvUrlSource  # noqa: E402
+
+# selenium, webdriver-manager a requests se importují až ve funkcích, které
+# je používají — import modulu nic nespouští ani nestahuje (vše dělá main()).
 
 # 🔧 Konfigurace — přes env proměnné
 MODE = os.environ.get("IG_MODE", "csv")          # "csv" nebo "saved"
 IG_USERNAME = os.environ.get("IG_USERNAME", "")
 IG_PASSWORD = os.environ.get("IG_PASSWORD", "")
 IG_COLLECTION = os.environ.get("IG_COLLECTION", "")  # název kolekce, prázdné = všechny uložené
+INCREMENTAL = os.environ.get("IG_INCREMENTAL", "") == "1"  # csv: jen řádky, které ještě nejsou exportované
+BROWSER_WORKERS = int(os.environ.get("IG_BROWSERS", "3"))           # souběžné headless prohlížeče
+PAGE_TIMEOUT = 15                                                  # s, čekání na obrázek příspěvku
+DOWNLOAD_WORKERS = int(os.environ.get("IG_DOWNLOAD_WORKERS", "8"))  # souběžná stahování obrázků
+CHUNK_SIZE = 64 * 1024
+MANIFEST_FILE = os.environ.get("IG_MANIFEST", "instagram_manifest.json")  # už exportované příspěvky
+CHECKPOINT_EVERY = 20                                              # zápis ZIP adresáře + manifestu po N příspěvcích
 CSV_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vTTsguvmetBw9DNbjPzbWMBlHydJgG6osQDVrdNqMYjZ7flrRdtYgTVQDXVODfRI14V8Bi_HyRpeEet/pub?gid=0&single=true&output=csv"
 
 
-def load_urls_from_csv(url):
-    resp = requests.get(url)
-    resp.raise_for_status()
-    df = pd.read_csv(StringIO(resp.text), header=None)
-    return df[0].dropna().tolist()
+def load_urls_from_csv(source, incremental=False):
+    """Vrací (URL, řádky CSV) — řádky kvůli potvrzení zpracovaných přes commit()."""
+    rows = [row for row in source.rows(incremental) if row and row[0].strip()]
+    return [row[0].strip() for row in rows], rows
 
 
 def instagram_login(driver):
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
     print("🔐 Přihlašuji se na Instagram...")
     driver.get("https://www.instagram.com/accounts/login/")
-    time.sleep(4)
+    wait = WebDriverWait(driver, 20)
+    wait.until(EC.presence_of_element_located((By.TAG_NAME, "form")))
 
     driver.save_screenshot("debug_login_page.png")
     print(f"📸 Screenshot: {driver.title} | URL: {driver.current_url}")
 
-    wait = WebDriverWait(driver, 20)
-
     # Cookies dialog
     try:
         cookie_btn = WebDriverWait(driver, 6).until(EC.element_to_be_clickable(
             (By.XPATH, "//button[contains(text(),'Allow') or contains(text(),'Povolit') or contains(text(),'Accept') or contains(text(),'Přijmout')]")
         ))
         cookie_btn.click()
-        time.sleep(2)
+        WebDriverWait(driver, 6).until(EC.staleness_of(cookie_btn))
     except Exception:
         pass
 
@@ -64,7 +73,10 @@ def instagram_login(driver):
     password_field = wait.until(EC.presence_of_element_located((By.NAME, "pass")))
     password_field.send_keys(IG_PASSWORD)
     password_field.submit()
-    time.sleep(6)
+    try:
+        wait.until(lambda d: "/accounts/login" not in d.current_url)
+    except TimeoutException:
+        pass
 
     driver.save_screenshot("debug_after_login.png")
     print(f"📸 Po přihlášení: {driver.title} | URL: {driver.current_url}")
@@ -76,7 +88,7 @@ def instagram_login(driver):
                 (By.XPATH, "//button[contains(text(),'Not Now') or contains(text(),'Teď ne') or contains(text(),'Nyní ne')]")
             ))
             btn.click()
-            time.sleep(2)
+            WebDriverWait(driver, 6).until(EC.staleness_of(btn))
         except Exception:
             pass
 
@@ -86,102 +98,160 @@ def instagram_login(driver):
 def find_collection_url(driver):
     """Najde URL konkrétní kolekce podle názvu na stránce uložených příspěvků."""
     driver.get(f"https://www.instagram.com/{IG_USERNAME}/saved/")
-    time.sleep(3)
+    wait_for_posts(driver)
 
     collection_name_lower = IG_COLLECTION.lower()
-    links = driver.find_elements(By.CSS_SELECTOR, "a[href*='/saved/']")
-    for link in links:
-        href = link.get_attribute("href")
-        text = link.text.strip().lower()
-        if not href or "/saved/" not in href or href.rstrip("/").endswith("/saved"):
-            continue
-        if collection_name_lower in text:
-            print(f"✅ Nalezena kolekce '{link.text.strip()}': {href}")
-            return href
-
-    # Záloha: hledej název v potomcích odkazu
-    for link in links:
-        href = link.get_attribute("href")
+    # Všechny odkazy na kolekce jedním voláním místo get_attribute na každý zvlášť
+    links = driver.execute_script("""
+        return Array.from(document.querySelectorAll("a[href*='/saved/']"))
+            .map(a => [a.href, (a.innerText || '').trim()]);
+    """)
+    for href, text in links:
         if not href or href.rstrip("/").endswith("/saved"):
             continue
-        try:
-            inner_text = link.get_attribute("innerText").strip().lower()
-        except Exception:
-            continue
-        if collection_name_lower in inner_text:
-            print(f"✅ Nalezena kolekce: {href}")
+        if collection_name_lower in text.lower():
+            print(f"✅ Nalezena kolekce '{text.splitlines()[0] if text else href}': {href}")
             return href
 
     print(f"❌ Kolekce '{IG_COLLECTION}' nebyla nalezena.")
     return None
 
 
-def scrape_posts_from_page(driver):
-    """Projede aktuální stránku (scrolluje) a vrátí URL všech příspěvků."""
-    post_urls = set()
-    last_height = 0
+def wait_for_posts(driver):
+    """Počká, až mřížka uložených příspěvků vykreslí první odkazy."""
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
 
-    while True:
-        links = driver.find_elements(By.CSS_SELECTOR, "a[href*='/p/']")
-        for link in links:
-            href = link.get_attribute("href")
-            if href and "/p/" in href:
-                post_urls.add(href.split("?")[0])
+    try:
+        WebDriverWait(driver, PAGE_TIMEOUT).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "a[href*='/p/'], a[href*='/saved/']"))
+        )
+    except TimeoutException:
+        print("⚠️ Stránka nenačetla žádné příspěvky včas.")
+
+
+# Jedno volání na scroll: nové odkazy na příspěvky, výška stránky a posun dolů.
+# Už vrácené odkazy si pamatuje stránka, takže se po WebDriveru neposílají znovu.
+SCROLL_AND_COLLECT_JS = """
+    const seen = window.__igSeenPosts || (window.__igSeenPosts = new Set());
+    const hrefs = [];
+    for (const a of document.querySelectorAll("a[href*='/p/']")) {
+        if (!seen.has(a.href)) { seen.add(a.href); hrefs.push(a.href); }
+    }
+    const height = document.body.scrollHeight;
+    window.scrollTo(0, height);
+    return [hrefs, height];
+"""
+
+
+def scrape_posts_from_page(driver, known_ids=()):
+    """Projede aktuální stránku (scrolluje) a vrátí URL příspěvků, od nejnovějšího.
+
+    Jakmile narazí na příspěvek z `known_ids` (manifest minulých běhů),
+    skončí — starší uložené příspěvky už jsou exportované.
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    post_urls = {}
 
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
+    while True:
+        hrefs, last_height = driver.execute_script(SCROLL_AND_COLLECT_JS)
+        reached_known = False
+        for href in hrefs:
+            if "/p/" not in href:
+                continue
+            url = href.split("?")[0]
+            post_urls.setdefault(url, None)
+            if post_id_of(url) in known_ids:
+                reached_known = True
+        if reached_known:
+            print("⏹️ Dosaženo příspěvků z minulého exportu, dál nescrolluji.")
+            break
 
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if new_height == last_height:
+        try:
+            # Konec seznamu = po scrollu se do pár sekund nic nedonačte
+            WebDriverWait(driver, 4, poll_frequency=0.25).until(
+                lambda d: d.execute_script("return document.body.scrollHeight") > last_height
+            )
+        except TimeoutException:
             break
-        last_height = new_height
 
-    return post_urls
+    return list(post_urls)
 
 
-def get_saved_post_urls(driver):
+def get_saved_post_urls(driver, known_ids=()):
     if IG_COLLECTION:
         print(f"📂 Hledám kolekci '{IG_COLLECTION}' pro @{IG_USERNAME}...")
         collection_url = find_collection_url(driver)
         if not collection_url:
             return []
         driver.get(collection_url)
-        time.sleep(3)
+        wait_for_posts(driver)
     else:
         print(f"📂 Načítám všechny uložené příspěvky pro @{IG_USERNAME}...")
         driver.get(f"https://www.instagram.com/{IG_USERNAME}/saved/")
-        time.sleep(3)
+        wait_for_posts(driver)
 
-    post_urls = scrape_posts_from_page(driver)
+    post_urls = scrape_posts_from_page(driver, known_ids)
     print(f"✅ Nalezeno {len(post_urls)} příspěvků.")
-    return list(post_urls)
+    return post_urls
+
+
+def post_id_of(url):
+    return os.path.basename(urlparse(url).path.strip("/"))
 
 
-def download_image_from_post(driver, url):
+def post_image_loaded(driver):
+    """Podmínka pro WebDriverWait: v <article> je aspoň jeden načtený obrázek z CDN."""
+    return driver.execute_script("""
+        return Array.from(document.querySelectorAll('article img')).some(
+            img => img.src.includes('cdninstagram.com') && img.complete && img.naturalWidth > 0
+        );
+    """)
+
+
+POST_IMAGES_JS = """
+    const root = document.querySelector('article') || document;
+    return Array.from(root.querySelectorAll('img'),
+                      img => [img.src, img.naturalWidth || 0, img.naturalHeight || 0]);
+"""
+
+
+def resolve_image_from_post(driver, url):
+    """Otevře příspěvek v prohlížeči a vrátí (post_id, URL největšího obrázku, plocha).
+
+    Nic nestahuje — o to se stará download_image ve vlákně poolu, takže
+    prohlížeč mezitím může otevírat další příspěvek.
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support.ui import WebDriverWait
+
     parsed = urlparse(url)
     clean_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
     try:
         driver.get(clean_url)
-        time.sleep(5)
     except Exception as e:
         print(f"❌ Nelze přistoupit na stránku: {e}")
         return None
+    try:
+        WebDriverWait(driver, PAGE_TIMEOUT, poll_frequency=0.2).until(post_image_loaded)
+    except TimeoutException:
+        print(f"⚠️ Obrázek příspěvku se nenačetl do {PAGE_TIMEOUT}s: {clean_url}")
 
-    articles = driver.find_elements(By.TAG_NAME, "article")
-    search_root = articles[0] if articles else driver
-    images = search_root.find_elements(By.TAG_NAME, "img")
+    # (src, šířka, výška) všech obrázků jedním voláním
+    images = driver.execute_script(POST_IMAGES_JS)
 
     best_src = None
     best_area = 0
-    for img in images:
-        src = img.get_attribute("src")
+    for src, w, h in images:
         if not src or "cdninstagram.com" not in src or src.endswith(".svg"):
             continue
         # Vylouč profilové fotky (mají t51.2885-19 v URL)
         if "t51.2885-19" in src:
             continue
-        w = driver.execute_script("return arguments[0].naturalWidth", img) or 0
-        h = driver.execute_script("return arguments[0].naturalHeight", img) or 0
         if w * h > best_area:
             best_area = w * h
             best_src = src
@@ -189,77 +259,306 @@ def download_image_from_post(driver, url):
     if not best_src:
         return None
 
-    post_id = os.path.basename(parsed.path.strip("/"))
-    filename = f"{post_id}.jpg"
+    return post_id_of(url), best_src, best_area
+
+
+def make_download_session(workers):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def salvage_zip(broken_path, zip_path, keep):
+    """Přepíše nepoškozené položky ZIP bez centrálního adresáře do nového archivu.
+
+    Čte lokální hlavičky za sebou; končí u první neúplné položky nebo
+    nesouhlasícího CRC. Zachrání jen jména z `keep` (ta, která zná
+    manifest) a vrací je.
+    """
+    present = set()
+    with open(broken_path, "rb") as src, \
+            zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as dst:
+        while True:
+            header = src.read(30)
+            if len(header) < 30 or header[:4] != b"PK\x03\x04":
+                break
+            _, _, _, method, _, _, crc, size, _, name_len, extra_len = struct.unpack("<4sHHHHHIIIHH", header)
+            name = src.read(name_len).decode("utf-8")
+            src.read(extra_len)
+            data = src.read(size)
+            if method != zipfile.ZIP_STORED or len(data) < size or zlib.crc32(data) != crc:
+                break
+            if name in keep:
+                dst.writestr(name, data)
+                present.add(name)
+    return present
+
+
+class ZipExport:
+    """Obrázky zapisované rovnou do ZIP (bez komprese) + manifest hotových příspěvků.
+
+    Stejný obsah (sha256) se do archivu uloží jen jednou; deduplikuje se
+    jen proti dnešnímu ZIP, starší archivy (artefakty) už nemusí existovat.
+    Každých CHECKPOINT_EVERY příspěvků se ZIP zavře — zapíše se centrální
+    adresář — a teprve pak se příspěvky zapíšou do manifestu. Přerušený běh
+    tak nechá platný archiv i manifest a další běh pokračuje jen s novými.
+    """
+
+    def __init__(self, zip_path, manifest_path=MANIFEST_FILE):
+        self.zip_path = zip_path
+        self.manifest_path = manifest_path
+        self.posts = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                self.posts = json.load(f).get("posts", {})
+        if os.path.exists(zip_path):
+            self._recover()
+        archive = os.path.basename(zip_path)
+        self.hashes = {entry["sha256"]: entry["file"] for entry in self.posts.values()
+                       if entry["archive"] == archive}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.zip = None
+        self.added = 0
+        self.duplicates = 0
+
+    def _recover(self):
+        """Z manifestu vyřadí příspěvky, které v dnešním ZIP po přerušení chybí."""
+        archive = os.path.basename(self.zip_path)
+        try:
+            with zipfile.ZipFile(self.zip_path) as zf:
+                present = set(zf.namelist())
+        except zipfile.BadZipFile:
+            broken = f"{self.zip_path}.broken"
+            os.replace(self.zip_path, broken)
+            keep = {entry["file"] for entry in self.posts.values() if entry["archive"] == archive}
+            present = salvage_zip(broken, self.zip_path, keep)
+            print(f"⚠️ Archiv bez centrálního adresáře (přerušený běh) — zachráněno {len(present)} "
+                  f"souborů, původní ponechán jako {broken}.")
+        lost = [post_id for post_id, entry in self.posts.items()
+                if entry["archive"] == archive and entry["file"] not in present]
+        for post_id in lost:
+            del self.posts[post_id]
+        if lost:
+            self._write_manifest()
+
+    def done(self, post_id):
+        return post_id in self.posts
+
+    def add(self, post_id, fileobj, sha256):
+        """Zapíše obrázek do archivu; vrací jméno souboru v ZIP (i u duplikátu)."""
+        with self.lock:
+            arcname = self.hashes.get(sha256)
+            if arcname:
+                self.duplicates += 1
+            else:
+                arcname = f"{post_id}.jpg"
+                if self.zip is None:
+                    self.zip = zipfile.ZipFile(self.zip_path, "a", compression=zipfile.ZIP_STORED)
+                with self.zip.open(arcname, "w") as dst:
+                    shutil.copyfileobj(fileobj, dst, CHUNK_SIZE)
+                self.hashes[sha256] = arcname
+                self.added += 1
+            self.pending[post_id] = {
+                "file": arcname,
+                "sha256": sha256,
+                "archive": os.path.basename(self.zip_path),
+                "exported": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+            if len(self.pending) >= CHECKPOINT_EVERY:
+                self._checkpoint()
+            return arcname
+
+    def _checkpoint(self):
+        if self.zip is not None:
+            self.zip.close()
+            self.zip = None
+        if not self.pending:
+            return
+        self.posts.update(self.pending)
+        self.pending = {}
+        self._write_manifest()
+
+    def _write_manifest(self):
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"posts": self.posts}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def close(self):
+        with self.lock:
+            self._checkpoint()
+
+
+def download_image(session, export, post_id, src, area):
+    """Stáhne obrázek po částech (do 1 MB v paměti, větší přes dočasný soubor) a předá ho do ZIP."""
+    digest = hashlib.sha256()
     try:
-        r = requests.get(best_src)
-        r.raise_for_status()
-        with open(filename, "wb") as f:
-            f.write(r.content)
-        print(f"✅ Uloženo jako {filename} ({int(best_area**0.5)}px)")
-        return filename
+        with session.get(src, stream=True, timeout=(10, 60)) as r, \
+                tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as buf:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                digest.update(chunk)
+                buf.write(chunk)
+            buf.seek(0)
+            arcname = export.add(post_id, buf, digest.hexdigest())
+        if arcname == f"{post_id}.jpg":
+            print(f"✅ Uloženo do ZIP jako {arcname} ({int(area**0.5)}px)")
+        else:
+            print(f"♻️ {post_id}: stejný obrázek už v archivu je ({arcname})")
+        return arcname
     except Exception as exc:
-        print(f"❌ Chyba při stahování: {exc}")
+        print(f"❌ Chyba při stahování {post_id}: {exc}")
         return None
 
 
 # ── Nastavení Chrome ──────────────────────────────────────────────────────────
-chrome_options = Options()
-chrome_options.add_argument("--headless=new")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--window-size=1920x1080")
-chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
-chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-chrome_options.add_experimental_option("useAutomationExtension", False)
-
-service = Service(ChromeDriverManager().install())
-driver = webdriver.Chrome(service=service, options=chrome_options)
-
-# Skryj webdriver příznak před JavaScriptem
-driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
-    "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
-})
-
-# ── Získání seznamu URL ───────────────────────────────────────────────────────
-if MODE == "saved":
-    if not IG_USERNAME or not IG_PASSWORD:
-        print("❌ Chybí IG_USERNAME nebo IG_PASSWORD.")
-        driver.quit()
-        exit(1)
-    instagram_login(driver)
-    urls = get_saved_post_urls(driver)
-else:
-    print(f"📥 Stahuji CSV z: {CSV_URL}")
-    urls = load_urls_from_csv(CSV_URL)
-    print(f"✅ Načteno {len(urls)} URL pro zpracování.")
-
-# ── Stahování obrázků ─────────────────────────────────────────────────────────
-downloaded_images = []
-for url in urls:
+def chrome_options():
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--window-size=1920x1080")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option("useAutomationExtension", False)
+    return options
+
+
+def chromedriver_path():
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    return ChromeDriverManager().install()
+
+
+def create_driver(driver_path):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    # Vlastní Service pro každý prohlížeč — Service si port volí v __init__
+    # a drží jediný proces chromedriveru, sdílený by se přepisoval.
+    driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options())
+    # Skryj webdriver příznak před JavaScriptem
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+        "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+    })
+    return driver
+
+
+def share_cookies(driver, cookies):
+    """Přenese přihlášení z prvního prohlížeče — cookies jdou nastavit jen na stejné doméně."""
+    driver.get("https://www.instagram.com/robots.txt")
+    for cookie in cookies:
+        cookie = {k: v for k, v in cookie.items() if k in ("name", "value", "path", "domain", "secure", "httpOnly", "expiry")}
+        if "expiry" in cookie:
+            cookie["expiry"] = int(cookie["expiry"])
+        try:
+            driver.add_cookie(cookie)
+        except Exception as exc:
+            print(f"⚠️ Cookie {cookie['name']} nejde přenést: {exc}")
+
+
+def process_post(drivers, pool, session, export, url):
+    """Vezme volný prohlížeč, zjistí URL obrázku a předá ho ke stažení."""
     print(f"\n🌐 Zpracovávám: {url}")
-    filename = download_image_from_post(driver, url)
-    if filename:
-        downloaded_images.append(filename)
-    else:
-        print("⚠️ Obrázek se nepodařilo najít.")
+    driver = drivers.get()
+    try:
+        resolved = resolve_image_from_post(driver, url)
+    except Exception as exc:
+        print(f"❌ Chyba při zpracování {url}: {exc}")
+        resolved = None
+    finally:
+        drivers.put(driver)
+    if not resolved:
+        print(f"⚠️ Obrázek se nepodařilo najít: {url}")
+        return None
+    return pool.submit(download_image, session, export, *resolved)
 
-driver.quit()
 
-# ── ZIP archiv ────────────────────────────────────────────────────────────────
-unique_images = list(dict.fromkeys(downloaded_images))
+def main():
+    if MODE == "saved" and (not IG_USERNAME or not IG_PASSWORD):
+        print("❌ Chybí IG_USERNAME nebo IG_PASSWORD.")
+        sys.exit(1)
+
+    driver_path = chromedriver_path()
+    driver = create_driver(driver_path)
 
-if not unique_images:
-    print("⚠️ Žádné obrázky ke zpracování. Žádný archiv nebude vytvořen.")
-else:
+    # ── Získání seznamu URL ───────────────────────────────────────────────────
     today_str = datetime.datetime.now().strftime("%Y-%m-%d")
     zip_filename = f"{today_str}_Instagram_Export.zip"
-    with zipfile.ZipFile(zip_filename, 'w') as zipf:
-        for fname in unique_images:
-            zipf.write(os.path.abspath(fname), arcname=fname)
-            print(f"📦 Přidáno do ZIP: {fname}")
-    print(f"\n📦 Archiv vytvořen: {zip_filename} (velikost: {os.path.getsize(zip_filename)} bytes)")
-
-    if IN_COLAB:
-        colab_files.download(zip_filename)
+    export = ZipExport(zip_filename)
+    url_source, csv_rows = None, []
+
+    if MODE == "saved":
+        instagram_login(driver)
+        urls = get_saved_post_urls(driver, export.posts.keys())
+    else:
+        print(f"📥 Stahuji CSV z: {CSV_URL}")
+        url_source = CsvUrlSource(CSV_URL, "instagram-csv")
+        urls, csv_rows = load_urls_from_csv(url_source, INCREMENTAL)
+        print(f"✅ Načteno {len(urls)} URL pro zpracování.")
+
+    # ── Přeskočení už exportovaných příspěvků ─────────────────────────────────
+    new_urls = list(dict.fromkeys(u for u in urls if not export.done(post_id_of(u))))
+    if len(new_urls) < len(urls):
+        print(f"⏭️  {len(urls) - len(new_urls)} příspěvků už je exportováno (manifest {MANIFEST_FILE}).")
+    urls = new_urls
+
+    # ── Pool prohlížečů ───────────────────────────────────────────────────────
+    browser_count = max(1, min(BROWSER_WORKERS, len(urls)))
+    all_drivers = [driver]
+    if browser_count > 1:
+        with ThreadPoolExecutor(max_workers=browser_count - 1) as starter:
+            all_drivers += list(starter.map(lambda _: create_driver(driver_path), range(browser_count - 1)))
+        if MODE == "saved":
+            cookies = driver.get_cookies()
+            for other in all_drivers[1:]:
+                share_cookies(other, cookies)
+        print(f"🧭 Příspěvky zpracovává {browser_count} prohlížečů.")
+
+    drivers = queue.Queue()
+    for browser in all_drivers:
+        drivers.put(browser)
+
+    # ── Stahování obrázků ─────────────────────────────────────────────────────
+    # Prohlížeče jen zjišťují URL obrázků (producenti), stahuje pool vláken (konzumenti)
+    session = make_download_session(DOWNLOAD_WORKERS)
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool, \
+            ThreadPoolExecutor(max_workers=browser_count) as browsers:
+        resolving = [browsers.submit(process_post, drivers, pool, session, export, url) for url in urls]
+        downloads = [f for f in (r.result() for r in resolving) if f]
+        for browser in all_drivers:
+            browser.quit()
+        for future in downloads:
+            future.result()
+    export.close()
+    if url_source:
+        # Potvrdit jen příspěvky, které jsou v manifestu — nestažené přijdou znovu
+        url_source.commit([row for row in csv_rows if export.done(post_id_of(row[0].strip()))])
+
+    # ── ZIP archiv ────────────────────────────────────────────────────────────
+    if not export.added:
+        print("⚠️ Žádné nové obrázky. Archiv nebyl vytvořen ani rozšířen.")
+    else:
+        print(f"\n📦 Archiv {zip_filename}: +{export.added} obrázků"
+              f"{f', {export.duplicates} duplicit vynecháno' if export.duplicates else ''} "
+              f"(velikost: {os.path.getsize(zip_filename)} bytes)")
+
+        try:
+            from google.colab import files as colab_files
+        except ImportError:
+            colab_files = None
+        if colab_files:
+            colab_files.download(zip_filename)
+
+
+if __name__ == "__main__":
+    main()
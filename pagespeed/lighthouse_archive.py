@@ -0,0 +1,260 @@
+"""
+Archiv surových lighthouseResult z PageSpeed testů.
+
+Každý běh pagespeedInsightsAPI.py zapisuje jeden shard
+`lighthouse-{YYYYmmddTHHMMSS}.jsonl.gz` (jen připisování, nic se nepřepisuje);
+řádek = jedno měření:
+
+    {"url", "strategy", "timestamp", "run", "lighthouseResult"}
+
+`timestamp` je TIMESTAMP řádku v BigQuery, takže se archiv dá spojit
+s tabulkou přes (URL, DEVICE_CATEGORY, TIMESTAMP). Index `index.db`
+(SQLite) říká, ve kterém shardu je které měření. Base64 screenshoty
+a lokalizační řetězce se neukládají — jsou to tři čtvrtiny objemu
+a žádná metrika z nich nejde spočítat.
+
+Shardy starší než PSI_ARCHIVE_KEEP_DAYS (výchozí 90) se při dalším
+běhu mažou i s řádky indexu (0 = nemazat nic).
+
+Zpětné doplnění metrik bez jediného volání API:
+    python lighthouse_archive.py --metrics TBT SI TTFB --since 2025-01-01 --out backfill.csv
+    python lighthouse_archive.py --bigquery-table projekt.dataset.pagespeed_backfill
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from statistics import median
+
+ARCHIVE_DIR = os.environ.get('PSI_ARCHIVE_DIR', 'lighthouse_archive')
+ARCHIVE_KEEP_DAYS = int(os.environ.get('PSI_ARCHIVE_KEEP_DAYS', '90'))
+INDEX_FILE = 'index.db'
+
+# Audity s base64 obrázky — v archivu se zahazují
+SCREENSHOT_AUDITS = ('screenshot-thumbnails', 'final-screenshot', 'full-page-screenshot')
+
+
+def _audit_seconds(audit_id):
+    def extract(lhr):
+        value = lhr.get('audits', {}).get(audit_id, {}).get('numericValue')
+        return None if value is None else value / 1000.0
+    return extract
+
+
+def _audit_value(audit_id):
+    def extract(lhr):
+        return lhr.get('audits', {}).get(audit_id, {}).get('numericValue')
+    return extract
+
+
+def _request_count(lhr):
+    items = lhr.get('audits', {}).get('network-requests', {}).get('details', {}).get('items')
+    return None if items is None else len(items)
+
+
+# Sloupec → funkce(lighthouseResult); časy v sekundách jako FCP/LCP v BigQuery
+METRICS = {
+    'TBT': _audit_seconds('total-blocking-time'),
+    'SI': _audit_seconds('speed-index'),
+    'TTFB': _audit_seconds('server-response-time'),
+    'TTI': _audit_seconds('interactive'),
+    'MAX_FID': _audit_seconds('max-potential-fid'),
+    'BOOTUP': _audit_seconds('bootup-time'),
+    'MAIN_THREAD': _audit_seconds('mainthread-work-breakdown'),
+    'DOM_SIZE': _audit_value('dom-size'),
+    'TOTAL_BYTES': _audit_value('total-byte-weight'),
+    'REQUESTS': _request_count,
+}
+
+
+def strip_lighthouse(lhr):
+    """Kopie lighthouseResult bez screenshotů a i18n."""
+    lhr = {k: v for k, v in lhr.items() if k not in ('i18n', 'fullPageScreenshot')}
+    audits = dict(lhr.get('audits', {}))
+    for audit_id in SCREENSHOT_AUDITS:
+        if audit_id in audits:
+            audits[audit_id] = {k: v for k, v in audits[audit_id].items() if k != 'details'}
+    lhr['audits'] = audits
+    return lhr
+
+
+class LighthouseArchive:
+    """Zapisovač jednoho shardu a index nad celým archivem."""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index = sqlite3.connect(self.directory / INDEX_FILE)
+        self.index.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                url TEXT NOT NULL,
+                strategy TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                run INTEGER NOT NULL,
+                shard TEXT NOT NULL,
+                PRIMARY KEY (url, strategy, timestamp, run)
+            )""")
+        self.index.commit()
+        self.shard = None
+        self._file = None
+        self.written = 0
+
+    def add(self, url, strategy, timestamp, results):
+        """Uloží lighthouseResult všech měření jednoho řádku BigQuery."""
+        if self._file is None:
+            self.shard = f"lighthouse-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.jsonl.gz"
+            self._file = gzip.open(self.directory / self.shard, 'at', encoding='utf-8')
+        for run, lhr in enumerate(results, 1):
+            record = {'url': url, 'strategy': strategy, 'timestamp': timestamp,
+                      'run': run, 'lighthouseResult': strip_lighthouse(lhr)}
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        # Sync flush — přerušený běh nechá čitelný shard až po poslední řádek
+        self._file.flush()
+        with self.index:
+            self.index.executemany(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)",
+                [(url, strategy, timestamp, run, self.shard) for run in range(1, len(results) + 1)]
+            )
+        self.written += len(results)
+
+    def prune(self, keep_days=ARCHIVE_KEEP_DAYS):
+        """Smaže shardy starší než keep_days dní; vrací počet smazaných."""
+        if keep_days <= 0:
+            return 0
+        cutoff = f"lighthouse-{(datetime.utcnow() - timedelta(days=keep_days)).strftime('%Y%m%dT%H%M%S')}"
+        # Název shardu začíná časem vzniku, takže stačí porovnat řetězce
+        old = sorted(p.name for p in self.directory.glob('lighthouse-*.jsonl.gz') if p.name < cutoff)
+        for name in old:
+            (self.directory / name).unlink()
+        with self.index:
+            self.index.execute("DELETE FROM runs WHERE shard < ?", (cutoff,))
+        return len(old)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.index.close()
+
+    # ── Čtení ────────────────────────────────────────────────────────────────
+
+    def shards(self, url=None, strategy=None, since=None, until=None):
+        """Shardy, které obsahují měření odpovídající filtru."""
+        query, params = "SELECT DISTINCT shard FROM runs WHERE 1=1", []
+        for column, op, value in (('url', '=', url), ('strategy', '=', strategy),
+                                  ('timestamp', '>=', since), ('timestamp', '<', until)):
+            if value:
+                query += f" AND {column} {op} ?"
+                params.append(value)
+        return [row[0] for row in self.index.execute(query + " ORDER BY shard", params)]
+
+    def iter_records(self, url=None, strategy=None, since=None, until=None):
+        for shard in self.shards(url, strategy, since, until):
+            with gzip.open(self.directory / shard, 'rt', encoding='utf-8') as f:
+                try:
+                    for line in f:
+                        record = json.loads(line)
+                        if url and record['url'] != url:
+                            continue
+                        if strategy and record['strategy'] != strategy:
+                            continue
+                        if since and record['timestamp'] < since:
+                            continue
+                        if until and record['timestamp'] >= until:
+                            continue
+                        yield record
+                except (EOFError, json.JSONDecodeError):
+                    # Shard z přerušeného běhu — co bylo flushnuté, je přečtené
+                    continue
+
+
+def extract_rows(records, metrics):
+    """Medián vybraných metrik přes měření se stejným (url, strategie, timestamp).
+
+    Z každého záznamu se hned vytáhnou jen čísla — lighthouseResult se
+    v paměti nedrží déle než jeden řádek archivu.
+    """
+    groups, runs = {}, {}
+    for record in records:
+        key = (record['url'], record['strategy'], record['timestamp'])
+        lhr = record['lighthouseResult']
+        values = groups.setdefault(key, {name: [] for name in metrics})
+        for name in metrics:
+            value = METRICS[name](lhr)
+            if value is not None:
+                values[name].append(value)
+        runs[key] = runs.get(key, 0) + 1
+
+    for key, values in sorted(groups.items(), key=lambda g: g[0][2]):
+        url, strategy, timestamp = key
+        row = {
+            'DATE': timestamp[:10],
+            'TIMESTAMP': timestamp,
+            'URL': url,
+            'DEVICE_CATEGORY': strategy,
+            'RUNS': runs[key],
+        }
+        for name in metrics:
+            row[name] = median(values[name]) if values[name] else None
+        yield row
+
+
+def load_to_bigquery(rows, table_id):
+    """Jeden load job (ne streaming insert) do samostatné tabulky."""
+    from google.cloud import bigquery
+
+    client = bigquery.Client()
+    job_config = bigquery.LoadJobConfig(
+        autodetect=True,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+    )
+    client.load_table_from_json(rows, table_id, job_config=job_config).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zpětné doplnění metrik z archivu lighthouseResult")
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    parser.add_argument('--metrics', nargs='+', choices=sorted(METRICS), default=sorted(METRICS),
+                        help="Sloupce k extrakci (výchozí: všechny)")
+    parser.add_argument('--url', help="Jen tato URL")
+    parser.add_argument('--strategy', choices=['MOBILE', 'DESKTOP'])
+    parser.add_argument('--since', help="Od data YYYY-MM-DD (včetně)")
+    parser.add_argument('--until', help="Do data YYYY-MM-DD (bez něj)")
+    parser.add_argument('--out', help="CSV soubor (výchozí: stdout)")
+    parser.add_argument('--bigquery-table', help="Nahrát výsledek do této BigQuery tabulky")
+    args = parser.parse_args()
+
+    if not (Path(args.archive_dir) / INDEX_FILE).exists():
+        sys.exit(f"❌ Archiv {args.archive_dir} neexistuje")
+    archive = LighthouseArchive(args.archive_dir)
+    records = archive.iter_records(args.url, args.strategy, args.since, args.until)
+    rows = list(extract_rows(records, args.metrics))
+    archive.close()
+
+    if args.bigquery_table:
+        if rows:
+            load_to_bigquery(rows, args.bigquery_table)
+        print(f"☁️ Nahráno {len(rows)} řádků do {args.bigquery_table}", file=sys.stderr)
+        return
+
+    fields = ['DATE', 'TIMESTAMP', 'URL', 'DEVICE_CATEGORY', 'RUNS', *args.metrics]
+    out = open(args.out, 'w', newline='', encoding='utf-8') if args.out else sys.stdout
+    try:
+        writer = csv.DictWriter(out, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if args.out:
+            out.close()
+    print(f"📊 {len(rows)} řádků z archivu {args.archive_dir}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
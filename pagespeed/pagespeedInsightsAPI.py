@@ -1,39 +1,119 @@
-import requests
 import time
 import os
 import sys
-from datetime import datetime
-from google.cloud import bigquery
-import gspread
-from google.oauth2 import service_account
+import json
+import random
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
 from statistics import median
+from lighthouse_archive import LighthouseArchive, ARCHIVE_DIR, ARCHIVE_KEEP_DAYS, strip_lighthouse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from url_source import SheetUrlSource  # noqa: E402
 
 # --- KONFIGURACE ---
 API_KEY = os.environ.get('PAGESPEED_API_KEY')
 BIGQUERY_TABLE_ID = os.environ.get('BIGQUERY_TABLE_ID')
 SPREADSHEET_ID = os.environ.get('SPREADSHEET_ID')
 SHEET_NAME = os.environ.get('SHEET_NAME', 'Sheet1')
-POCET_OPAKOVANI = 3
+MIN_OPAKOVANI = int(os.environ.get('PSI_MIN_RUNS', '2'))         # stabilní stránky: stačí N měření
+MAX_OPAKOVANI = int(os.environ.get('PSI_MAX_RUNS', '5'))         # rozptýlené: přidávej až do N
+ROZPTYL_SKORE = float(os.environ.get('PSI_SCORE_SPREAD', '3'))   # max − min skóre v bodech
+ROZPTYL_LCP = float(os.environ.get('PSI_LCP_SPREAD', '0.15'))    # (max − min) / medián LCP
+SOUBEZNOST = int(os.environ.get('PSI_CONCURRENCY', '6'))        # souběžně testovaných (URL, strategie)
+LIMIT_ZA_MINUTU = float(os.environ.get('PSI_QUERIES_PER_MINUTE', '240'))  # kvóta PSI API
+MAX_POKUSU_429 = 5
+LIMIT_VYCERPANI = int(os.environ.get('PSI_QUOTA_STRIKES', '3'))  # po N vyčerpaných 429 za sebou konec
+BQ_DAVKA_RADKU = int(os.environ.get('BQ_BATCH_ROWS', '50'))         # flush po N řádcích
+BQ_DAVKA_SEKUND = float(os.environ.get('BQ_BATCH_SECONDS', '60'))   # ... nebo po N sekundách
+BQ_SPOOL_FILE = os.environ.get('BQ_SPOOL_FILE', 'bigquery_spool.jsonl')
+BQ_MAX_POKUSU = 4
+CACHE_FILE = os.environ.get('PSI_CACHE_FILE', 'pagespeed_cache.db')
+INKREMENTALNE = os.environ.get('PSI_INCREMENTAL', '') == '1'        # jen URL nově přidané do sheetu
+CERSTVOST_HODIN = float(os.environ.get('PSI_FRESH_HOURS', '20'))     # přeskoč dvojice změřené před méně než N h
 # ---------------------
 
-def fetch_urls_from_spreadsheet(spreadsheet_id, sheet_name):
-    """Načte URL a Category z Google Spreadsheet."""
+class TokenBucket:
+    """Token bucket — nejvýš `rate` požadavků za sekundu, nárazově `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class QuotaBreaker:
+    """Jistič sdílený vlákny: po `limit` měřeních za sebou, kterým došly
+    všechny pokusy na 429, považuje denní kvótu za vyčerpanou a další
+    měření se nespouštějí. Úspěšné měření počítadlo nuluje.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.strikes = 0
+        self.lock = threading.Lock()
+        self.tripped = threading.Event()
+
+    def exhausted(self):
+        with self.lock:
+            self.strikes += 1
+            if self.strikes >= self.limit and not self.tripped.is_set():
+                self.tripped.set()
+                log(f"🛑 {self.strikes}× za sebou vyčerpány pokusy na 429 — kvóta PSI API je nejspíš "
+                    f"vyčerpaná, další testy se nespouštějí")
+
+    def success(self):
+        with self.lock:
+            self.strikes = 0
+
+rate_limiter = TokenBucket(LIMIT_ZA_MINUTU / 60, capacity=max(1, SOUBEZNOST))
+quota_breaker = QuotaBreaker(LIMIT_VYCERPANI)
+session = None   # requests.Session, vytváří main() — import requests až když je potřeba
+print_lock = threading.Lock()
+
+def make_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    http = requests.Session()
+    http.mount('https://', HTTPAdapter(pool_maxsize=max(10, SOUBEZNOST)))
+    return http
+
+def log(msg):
+    """Tisk celého řádku najednou — vlákna si výstup nepromíchají."""
+    with print_lock:
+        print(msg, flush=True)
+
+def fetch_urls_from_spreadsheet(source, incremental=False):
+    """Načte URL a Category z Google Spreadsheet (přes lokální cache snímku)."""
+    import requests
+
     print(f"📊 Načítám data z Google Spreadsheet...")
-    print(f"   Spreadsheet ID: {spreadsheet_id}")
-    print(f"   List: {sheet_name}")
+    print(f"   Spreadsheet ID: {source.spreadsheet_id}")
+    print(f"   List: {source.sheet_name}")
     
     try:
-        credentials = service_account.Credentials.from_service_account_file(
-            os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'),
-            scopes=['https://www.googleapis.com/auth/spreadsheets.readonly']
-        )
-        
-        gc = gspread.authorize(credentials)
-        spreadsheet = gc.open_by_key(spreadsheet_id)
-        worksheet = spreadsheet.worksheet(sheet_name)
-        
-        all_records = worksheet.get_all_records()
+        all_records = source.records(incremental)
         
+        if not all_records and incremental:
+            print("✅ Ve spreadsheetu nejsou žádné nové URL.")
+            return []
         if not all_records:
             print("❌ Chyba: Spreadsheet neobsahuje žádná data.")
             return None
@@ -46,7 +126,8 @@ def fetch_urls_from_spreadsheet(spreadsheet_id, sheet_name):
             if url:
                 url_data.append({
                     'url': url,
-                    'category': category if category else 'Uncategorized'
+                    'category': category if category else 'Uncategorized',
+                    'record': record
                 })
         
         if not url_data:
@@ -60,12 +141,15 @@ def fetch_urls_from_spreadsheet(spreadsheet_id, sheet_name):
         
         return url_data
         
-    except gspread.exceptions.SpreadsheetNotFound:
-        print(f"❌ Chyba: Spreadsheet s ID '{spreadsheet_id}' nebyl nalezen.")
-        print("   Zkontroluj, zda je spreadsheet sdílený se service accountem.")
-        return None
-    except gspread.exceptions.WorksheetNotFound:
-        print(f"❌ Chyba: List '{sheet_name}' nebyl ve spreadsheetu nalezen.")
+    except requests.exceptions.HTTPError as e:
+        status = e.response.status_code
+        if status in (403, 404):
+            print(f"❌ Chyba: Spreadsheet s ID '{source.spreadsheet_id}' nebyl nalezen.")
+            print("   Zkontroluj, zda je spreadsheet sdílený se service accountem.")
+        elif status == 400:
+            print(f"❌ Chyba: List '{source.sheet_name}' nebyl ve spreadsheetu nalezen.")
+        else:
+            print(f"❌ Chyba při načítání spreadsheetu: {e}")
         return None
     except Exception as e:
         print(f"❌ Chyba při načítání spreadsheetu: {e}")
@@ -74,8 +158,15 @@ def fetch_urls_from_spreadsheet(spreadsheet_id, sheet_name):
         return None
 
 def check_pagespeed(url_to_check, strategy):
-    """Spustí PageSpeed test a vrací metriky."""
-    
+    """Spustí PageSpeed test a vrací metriky.
+
+    Při 429 počká (Retry-After nebo exponenciální backoff) a zkusí to znovu,
+    nejvýš MAX_POKUSU_429×. Čerpá z globálního token bucketu podle kvóty API.
+    Když pokusy dojdou, hlásí to jističi quota_breaker; po jeho vypnutí
+    už žádný požadavek neodchází.
+    """
+    import requests
+
     api_endpoint = "https://www.googleapis.com/pagespeedonline/v5/runPagespeed"
     params = {
         'url': url_to_check, 
@@ -84,103 +175,305 @@ def check_pagespeed(url_to_check, strategy):
         'category': 'PERFORMANCE'
     }
 
-    try:
-        response = requests.get(api_endpoint, params=params, timeout=120)
-        response.raise_for_status() 
-        data = response.json()
-
-        if 'error' in data:
-            print(f"❌ Chyba API: {data['error'].get('message', 'Neznámá chyba')}")
+    for attempt in range(1, MAX_POKUSU_429 + 1):
+        if quota_breaker.tripped.is_set():
             return None
+        rate_limiter.acquire()
+        try:
+            response = session.get(api_endpoint, params=params, timeout=120)
+            if response.status_code == 429:
+                if attempt == MAX_POKUSU_429:
+                    log(f"   ❌ 429 pro {url_to_check} ({strategy}) — vyčerpáno {MAX_POKUSU_429} pokusů")
+                    quota_breaker.exhausted()
+                    return None
+                retry_after = response.headers.get('Retry-After', '')
+                wait = int(retry_after) if retry_after.isdigit() else 2 ** attempt * 5
+                wait += random.uniform(0, wait / 4)
+                log(f"   ⏳ 429 pro {url_to_check} ({strategy}) — čekám {wait:.0f}s "
+                    f"(pokus {attempt}/{MAX_POKUSU_429})")
+                # Event.wait místo sleep — po vypnutí jističe se nečeká zbytečně
+                quota_breaker.tripped.wait(wait)
+                continue
+            response.raise_for_status() 
+            data = response.json()
 
-        audits = data.get('lighthouseResult', {}).get('audits', {})
-        
-        fcp_val = audits.get('first-contentful-paint', {}).get('numericValue', 0) / 1000.0
-        lcp_val = audits.get('largest-contentful-paint', {}).get('numericValue', 0) / 1000.0
-        cls_val = audits.get('cumulative-layout-shift', {}).get('numericValue', 0)
-        score_val = int(data['lighthouseResult']['categories']['performance']['score'] * 100)
-        
-        return {
-            "fcp": fcp_val,
-            "lcp": lcp_val,
-            "cls": cls_val,
-            "score": score_val
-        }
+            if 'error' in data:
+                log(f"   ❌ Chyba API: {data['error'].get('message', 'Neznámá chyba')}")
+                return None
+
+            audits = data.get('lighthouseResult', {}).get('audits', {})
+            
+            fcp_val = audits.get('first-contentful-paint', {}).get('numericValue', 0) / 1000.0
+            lcp_val = audits.get('largest-contentful-paint', {}).get('numericValue', 0) / 1000.0
+            cls_val = audits.get('cumulative-layout-shift', {}).get('numericValue', 0)
+            score_val = int(data['lighthouseResult']['categories']['performance']['score'] * 100)
+            quota_breaker.success()
+            
+            return {
+                "fcp": fcp_val,
+                "lcp": lcp_val,
+                "cls": cls_val,
+                "score": score_val,
+                # Bez screenshotů hned ve vlákně — plný výsledek má jednotky MB
+                "lighthouse": strip_lighthouse(data['lighthouseResult'])
+            }
+
+        except requests.exceptions.HTTPError as e:
+            log(f"   ❌ HTTP Chyba: {e.response.status_code} {e.response.reason} ({url_to_check}, {strategy})")
+        except Exception as e:
+            log(f"   ❌ Neočekávaná chyba: {e} ({url_to_check}, {strategy})")
+        return None
 
-    except requests.exceptions.HTTPError as e:
-        print(f"❌ HTTP Chyba: {e.response.status_code} {e.response.reason}")
-        if e.response.status_code == 429: return 'STOP'
-    except Exception as e:
-        print(f"❌ Neočekávaná chyba: {e}")
-    
     return None
 
-def test_url_multiple_times(url, strategy, pocet_opakovani=3):
+def median_metrics_of(measurements):
+    """Medián každé metriky z jednotlivých měření a jejich rozptyl (max − min)."""
+    scores = [m['score'] for m in measurements]
+    lcps = [m['lcp'] for m in measurements]
+    return {
+        'fcp': median(m['fcp'] for m in measurements),
+        'lcp': median(lcps),
+        'cls': median(m['cls'] for m in measurements),
+        'score': int(median(scores)),
+        'runs': len(measurements),
+        'score_spread': max(scores) - min(scores),
+        'lcp_spread': max(lcps) - min(lcps)
+    }
+
+def is_stable(measurements):
+    """Skóre i LCP se mezi měřeními liší méně než ROZPTYL_SKORE / ROZPTYL_LCP."""
+    summary = median_metrics_of(measurements)
+    lcp_ok = summary['lcp_spread'] <= ROZPTYL_LCP * max(summary['lcp'], 0.1)
+    return summary['score_spread'] <= ROZPTYL_SKORE and lcp_ok
+
+def test_url_multiple_times(url, strategy, min_runs=MIN_OPAKOVANI, max_runs=MAX_OPAKOVANI):
     """
-    Otestuje URL několikrát a vrátí medián z výsledků.
+    Otestuje URL opakovaně a vrátí medián z výsledků.
+
+    Po min_runs úspěšných měřeních skončí, pokud jsou výsledky stabilní
+    (is_stable); jinak přidává měření, dokud se neustálí, nejvýš max_runs pokusů.
     """
-    print(f"\n⚙️  Testuji: {url} (Strategie: {strategy})")
-    print(f"   Počet měření: {pocet_opakovani}x")
+    label = f"{url} ({strategy})"
+    log(f"\n⚙️  Testuji: {label} — {min_runs}–{max_runs}x")
     
     all_measurements = []
     
-    for i in range(pocet_opakovani):
-        print(f"   📊 Měření {i+1}/{pocet_opakovani}...", end=" ")
-        
+    for i in range(max_runs):
+        if quota_breaker.tripped.is_set():
+            # Neúplné měření neukládat — dvojice se změří celá v dalším běhu
+            log(f"   🛑 {label}: přerušeno, kvóta API vyčerpána")
+            return None
         metrics = check_pagespeed(url, strategy)
         
-        if metrics == 'STOP':
-            return 'STOP'
-        
         if metrics:
             all_measurements.append(metrics)
-            print(f"Skóre: {metrics['score']} | FCP: {metrics['fcp']:.2f}s | LCP: {metrics['lcp']:.2f}s | CLS: {metrics['cls']:.4f}")
+            log(f"   📊 {label} měření {i+1}/{max_runs}: "
+                f"Skóre: {metrics['score']} | FCP: {metrics['fcp']:.2f}s | LCP: {metrics['lcp']:.2f}s | CLS: {metrics['cls']:.4f}")
         else:
-            print("Selhalo")
-        
-        if i < pocet_opakovani - 1:
-            time.sleep(0.5)
+            log(f"   📊 {label} měření {i+1}/{max_runs}: Selhalo")
+
+        if len(all_measurements) >= min_runs and is_stable(all_measurements):
+            break
     
     if not all_measurements:
-        print("   ❌ Všechna měření selhala")
+        log(f"   ❌ {label}: všechna měření selhala")
         return None
     
-    fcp_values = [m['fcp'] for m in all_measurements]
-    lcp_values = [m['lcp'] for m in all_measurements]
-    cls_values = [m['cls'] for m in all_measurements]
-    score_values = [m['score'] for m in all_measurements]
+    median_metrics = median_metrics_of(all_measurements)
+    median_metrics['lighthouse'] = [m['lighthouse'] for m in all_measurements]
     
-    median_metrics = {
-        'fcp': median(fcp_values),
-        'lcp': median(lcp_values),
-        'cls': median(cls_values),
-        'score': int(median(score_values))
-    }
-    
-    print(f"   ✅ MEDIÁN: Skóre: {median_metrics['score']} | "
-          f"FCP: {median_metrics['fcp']:.2f}s | "
-          f"LCP: {median_metrics['lcp']:.2f}s | "
-          f"CLS: {median_metrics['cls']:.4f}")
+    log(f"   ✅ {label} MEDIÁN z {median_metrics['runs']}: Skóre: {median_metrics['score']} | "
+        f"FCP: {median_metrics['fcp']:.2f}s | "
+        f"LCP: {median_metrics['lcp']:.2f}s | "
+        f"CLS: {median_metrics['cls']:.4f} | "
+        f"rozptyl skóre {median_metrics['score_spread']}, LCP {median_metrics['lcp_spread']:.2f}s")
     
     return median_metrics
 
-def insert_to_bigquery(client, rows_to_insert):
-    """Vloží připravené řádky do BigQuery."""
-    if not rows_to_insert:
-        return
+class BigQueryWriter:
+    """Dávkový zápis do BigQuery s lokálním spoolem.
 
-    try:
-        errors = client.insert_rows_json(BIGQUERY_TABLE_ID, rows_to_insert)
-        if not errors:
-            print(f"   ☁️ ✅ Uloženo do BigQuery ({len(rows_to_insert)} řádků)")
-        else:
-            print("   ❌ Chyba při vkládání dat do BigQuery:")
-            for error in errors:
-                print(f"      {error}")
-    except Exception as e:
-        print(f"   ❌ Chyba při komunikaci s BigQuery: {e}")
+    Řádky se hromadí a posílají jedním insert_rows_json, jakmile jich je
+    BQ_DAVKA_RADKU nebo uplyne BQ_DAVKA_SEKUND. Přechodné chyby se opakují
+    s backoffem; co neprojde ani tak, skončí v JSONL spoolu a při dalším
+    běhu se odešle znovu (replay_spool).
+
+    `on_persisted(rows)` se volá po každé dávce, která je v BigQuery nebo
+    ve spoolu — dřív o řádcích nesmí vědět checkpoint (ResultCache).
+    """
+
+    def __init__(self, client, table_id, max_rows=BQ_DAVKA_RADKU, max_seconds=BQ_DAVKA_SEKUND,
+                 spool_path=BQ_SPOOL_FILE, on_persisted=None):
+        self.client = client
+        self.table_id = table_id
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.spool_path = spool_path
+        self.on_persisted = on_persisted
+        self.buffer = []
+        self.first_added = None
+        self.saved = 0
+        self.spooled = 0
+
+    @staticmethod
+    def row_id(row):
+        # insertId pro deduplikaci v BigQuery, když se dávka pošle vícekrát
+        return f"{row['URL']}|{row['DEVICE_CATEGORY']}|{row['TIMESTAMP']}"
+
+    def add(self, row):
+        if not self.buffer:
+            self.first_added = time.monotonic()
+        self.buffer.append(row)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flush při plné dávce nebo po max_seconds od prvního řádku v bufferu."""
+        if self.buffer and (len(self.buffer) >= self.max_rows
+                            or time.monotonic() - self.first_added >= self.max_seconds):
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        failed = self._insert(rows)
+        self.saved += len(rows) - len(failed)
+        if failed:
+            self._spool(failed)
+        if self.on_persisted:
+            self.on_persisted(rows)
+
+    def close(self):
+        self.flush()
+
+    def _insert(self, rows):
+        """Vloží řádky; vrací ty, které se nepodařilo uložit."""
+        for attempt in range(1, BQ_MAX_POKUSU + 1):
+            try:
+                errors = self.client.insert_rows_json(
+                    self.table_id, rows, row_ids=[self.row_id(r) for r in rows]
+                )
+            except Exception as e:
+                if attempt == BQ_MAX_POKUSU:
+                    log(f"   ❌ Chyba při komunikaci s BigQuery: {e}")
+                    return rows
+                wait = 2 ** attempt
+                log(f"   ⚠️ BigQuery nedostupné ({e}) — čekám {wait}s (pokus {attempt}/{BQ_MAX_POKUSU})")
+                time.sleep(wait)
+                continue
+
+            if not errors:
+                log(f"   ☁️ ✅ Uloženo do BigQuery ({len(rows)} řádků)")
+                return []
+            log(f"   ❌ Chyba při vkládání dat do BigQuery ({len(errors)} řádků):")
+            for error in errors[:5]:
+                log(f"      {error}")
+            bad = {e['index'] for e in errors if 'index' in e}
+            return [r for i, r in enumerate(rows) if i in bad] if bad else rows
+        return rows
+
+    def _spool(self, rows):
+        with open(self.spool_path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.spooled += len(rows)
+        log(f"   💾 {len(rows)} řádků uloženo do spoolu {self.spool_path} — odešlou se při dalším běhu")
+
+    def replay_spool(self):
+        """Odešle řádky, které v minulých bězích neprošly.
+
+        Spool se přepíše (atomicky) až po odeslání a jen tím, co zase neprošlo —
+        přerušení uprostřed ho nechá celý a další běh ho pošle znovu
+        (duplicity odfiltruje BigQuery podle insertId).
+        """
+        if not os.path.exists(self.spool_path):
+            return 0
+        with open(self.spool_path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        if not rows:
+            return 0
+        log(f"💾 Odesílám {len(rows)} řádků ze spoolu {self.spool_path}...")
+        still_failed = []
+        for i in range(0, len(rows), self.max_rows):
+            batch = rows[i:i + self.max_rows]
+            failed = self._insert(batch)
+            self.saved += len(batch) - len(failed)
+            still_failed.extend(failed)
+            if self.on_persisted:
+                self.on_persisted(batch)
+
+        # Přepsat, ne smazat — prázdný soubor přepíše i cache v CI
+        tmp = f"{self.spool_path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for row in still_failed:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        os.replace(tmp, self.spool_path)
+        if still_failed:
+            self.spooled += len(still_failed)
+            log(f"   💾 {len(still_failed)} řádků zůstává ve spoolu {self.spool_path}")
+        return len(rows)
+
+class ResultCache:
+    """Lokální SQLite záznam dokončených měření, klíč (url, strategie, datum).
+
+    Díky němu běh přerušený kvótou pokračuje tam, kde skončil, a dvojice
+    změřené před méně než CERSTVOST_HODIN se znovu netestují.
+    """
+
+    def __init__(self, path=CACHE_FILE):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS measurements (
+                url TEXT NOT NULL,
+                strategy TEXT NOT NULL,
+                date TEXT NOT NULL,
+                measured_at REAL NOT NULL,
+                fcp REAL, lcp REAL, cls REAL, score INTEGER,
+                PRIMARY KEY (url, strategy, date)
+            )""")
+        self.conn.commit()
+
+    def last_measured(self):
+        """{(url, strategie): unix čas posledního měření}"""
+        rows = self.conn.execute(
+            "SELECT url, strategy, MAX(measured_at) FROM measurements GROUP BY url, strategy"
+        )
+        return {(url, strategy): ts for url, strategy, ts in rows}
+
+    def record_rows(self, rows):
+        """Zapíše řádky BigQuery — volat až když jsou uložené nebo ve spoolu."""
+        def measured_at(row):
+            ts = datetime.fromisoformat(row['TIMESTAMP'].rstrip('Z'))
+            return ts.replace(tzinfo=timezone.utc).timestamp()
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(r['URL'], r['DEVICE_CATEGORY'], r['DATE'], measured_at(r),
+                  r['FCP'], r['LCP'], r['CLS'], r['OVERALL_SCORE']) for r in rows]
+            )
+
+    def close(self):
+        self.conn.close()
+
+def plan_pairs(url_data, strategies, cache, fresh_hours=CERSTVOST_HODIN):
+    """Dvojice k otestování — bez čerstvých, nejdéle neměřené první."""
+    last = cache.last_measured()
+    cutoff = time.time() - fresh_hours * 3600
+    pairs, fresh = [], 0
+    for data in url_data:
+        for strategy in strategies:
+            measured = last.get((data['url'], strategy))
+            if measured and measured > cutoff:
+                fresh += 1
+                continue
+            pairs.append((measured or 0, data, strategy))
+    # Stabilní řazení: nikdy neměřené (0) první, pak od nejstaršího měření
+    pairs.sort(key=lambda p: p[0])
+    return [(data, strategy) for _, data, strategy in pairs], fresh
 
 def main():
+    global session
     if not API_KEY:
         sys.exit("❌ CHYBA: Secret 'PAGESPEED_API_KEY' nebyl nalezen.")
     if not BIGQUERY_TABLE_ID:
@@ -188,67 +481,116 @@ def main():
     if not SPREADSHEET_ID:
         sys.exit("❌ CHYBA: Variable 'SPREADSHEET_ID' nebyla nalezena.")
         
+    from google.cloud import bigquery
+
+    session = make_session()
+    cache = ResultCache()
     bq_client = bigquery.Client()
+    bq_writer = BigQueryWriter(bq_client, BIGQUERY_TABLE_ID, on_persisted=cache.record_rows)
+    bq_writer.replay_spool()
 
-    url_data = fetch_urls_from_spreadsheet(SPREADSHEET_ID, SHEET_NAME)
-    if not url_data:
+    url_source = SheetUrlSource(os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'), SPREADSHEET_ID, SHEET_NAME)
+    url_data = fetch_urls_from_spreadsheet(url_source, INKREMENTALNE)
+    if url_data is None:
         sys.exit("--- Testování ukončeno kvůli chybě při načítání spreadsheetu ---") 
     
     strategies_to_test = ['MOBILE', 'DESKTOP']
     
     print(f"\n{'='*60}")
     print(f"--- Zahajuji testování {len(url_data)} URL ---")
-    print(f"--- Každá URL bude testována {POCET_OPAKOVANI}x pro každou strategii ---")
-    print(f"--- Výsledky budou průběžně ukládány do BigQuery ---")
+    print(f"--- Každá URL bude testována {MIN_OPAKOVANI}–{MAX_OPAKOVANI}x pro každou strategii "
+          f"(dokud se skóre/LCP neustálí) ---")
+    print(f"--- Souběžně {SOUBEZNOST} testů, limit {LIMIT_ZA_MINUTU:.0f} požadavků/min ---")
+    print(f"--- Výsledky budou ukládány do BigQuery po dávkách ({BQ_DAVKA_RADKU} řádků / {BQ_DAVKA_SEKUND:.0f}s) ---")
     print(f"{'='*60}")
     
-    total_tests = len(url_data) * len(strategies_to_test)
+    archive = LighthouseArchive() if ARCHIVE_DIR else None
+    if archive:
+        pruned = archive.prune()
+        if pruned:
+            print(f"🗑️  Smazáno {pruned} shardů archivu Lighthouse starších než {ARCHIVE_KEEP_DAYS} dní")
+    pairs, fresh = plan_pairs(url_data, strategies_to_test, cache)
+    if fresh:
+        print(f"⏭️  Přeskakuji {fresh} dvojic (URL, strategie) změřených za posledních {CERSTVOST_HODIN:.0f} h")
+    total_tests = len(pairs)
     current_test = 0
-    total_saved = 0
+    skipped = 0
+    remaining = Counter(data['url'] for data, _ in pairs)   # dvojice bez zapsaného řádku
 
-    for data in url_data:
-        url = data['url']
-        category = data['category']
-        
-        for strategy in strategies_to_test:
-            current_test += 1
-            print(f"\n{'='*60}")
-            print(f"[Test {current_test}/{total_tests}] URL: {url[:50]}... | Kategorie: {category}")
-            print(f"{'='*60}")
-            
-            median_metrics = test_url_multiple_times(url, strategy, POCET_OPAKOVANI)
-            
-            if median_metrics == 'STOP':
-                print("\n!!! ZASTAVENO: API vrátilo chybu 429. Ukončuji skript.")
-                break
+    with ThreadPoolExecutor(max_workers=SOUBEZNOST) as executor:
+        futures = {
+            executor.submit(test_url_multiple_times, data['url'], strategy): (data, strategy)
+            for data, strategy in pairs
+        }
+        pending = set(futures)
+        try:
+            # Medián každé dvojice se ukládá hned, jak je dvojice dokončená; wait
+            # s timeoutem hlídá BQ_DAVKA_SEKUND i když testy visí v backoffu po 429
+            while pending:
+                done, pending = wait(pending, timeout=min(5, BQ_DAVKA_SEKUND),
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    data, strategy = futures[future]
+                    current_test += 1
+                    try:
+                        median_metrics = future.result()
+                    except Exception as e:
+                        log(f"❌ Test {data['url']} ({strategy}) selhal: {e}")
+                        median_metrics = None
+                    log(f"[Test {current_test}/{total_tests}] URL: {data['url'][:50]}... | "
+                        f"Kategorie: {data['category']} | {strategy}")
             
-            if median_metrics:
-                now = datetime.utcnow()
-                row = {
-                    "DATE": now.strftime("%Y-%m-%d"),
-                    "TIMESTAMP": now.isoformat() + "Z",
-                    "URL": url,
-                    "CATEGORY": category,
-                    "DEVICE_CATEGORY": strategy,
-                    "FCP": median_metrics["fcp"],
-                    "LCP": median_metrics["lcp"],
-                    "CLS": median_metrics["cls"],
-                    "OVERALL_SCORE": median_metrics["score"]
-                }
+                    if median_metrics:
+                        now = datetime.utcnow()
+                        row = {
+                            "DATE": now.strftime("%Y-%m-%d"),
+                            "TIMESTAMP": now.isoformat() + "Z",
+                            "URL": data['url'],
+                            "CATEGORY": data['category'],
+                            "DEVICE_CATEGORY": strategy,
+                            "FCP": median_metrics["fcp"],
+                            "LCP": median_metrics["lcp"],
+                            "CLS": median_metrics["cls"],
+                            "OVERALL_SCORE": median_metrics["score"],
+                            "RUNS": median_metrics["runs"],
+                            "SCORE_SPREAD": median_metrics["score_spread"],
+                            "LCP_SPREAD": median_metrics["lcp_spread"]
+                        }
                 
-                # OKAMŽITĚ uložíme do BigQuery
-                insert_to_bigquery(bq_client, [row])
-                total_saved += 1
-            
-            if current_test < total_tests:
-                time.sleep(1)
-        
-        if median_metrics == 'STOP':
-            break
+                        bq_writer.add(row)
+                        remaining[data['url']] -= 1
+                        # pop — dokončený future drží výsledek až do konce executoru
+                        lighthouse = median_metrics.pop('lighthouse')
+                        if archive:
+                            archive.add(data['url'], strategy, row['TIMESTAMP'], lighthouse)
+                bq_writer.flush_if_due()
+                if quota_breaker.tripped.is_set() and pending:
+                    # Nezačaté testy zrušit; rozběhnuté skončí na kontrole jističe
+                    not_started = [f for f in pending if f.cancel()]
+                    skipped += len(not_started)
+                    pending -= set(not_started)
+        finally:
+            # I při přerušení (zrušený job, výjimka) odeslat/spoolovat buffer — dřív,
+            # než executor začne čekat na rozběhnuté testy
+            executor.shutdown(wait=False, cancel_futures=True)
+            bq_writer.close()
+            cache.close()
+            if archive:
+                archive.close()
+
+    # Potvrdit jen URL, jejichž všechny dvojice zapsaly řádek (nebo byly čerstvé) —
+    # selhané a po vyčerpání kvóty nezačaté vrátí příští inkrementální běh znovu
+    url_source.commit([data['record'] for data in url_data if remaining[data['url']] <= 0])
 
     print(f"\n{'='*60}")
-    print(f"📊 Celkem uloženo {total_saved} úspěšných měření do BigQuery")
+    print(f"📊 Celkem uloženo {bq_writer.saved} úspěšných měření do BigQuery")
+    if bq_writer.spooled:
+        print(f"💾 {bq_writer.spooled} řádků čeká ve spoolu {BQ_SPOOL_FILE} na další běh")
+    if archive and archive.written:
+        print(f"🗄️  {archive.written} lighthouseResult archivováno v {ARCHIVE_DIR}/{archive.shard}")
     print(f"{'='*60}")
+    if quota_breaker.tripped.is_set():
+        sys.exit(f"🛑 Kvóta PageSpeed API vyčerpána — {skipped} dvojic nezačato, dokončí je další běh")
     print("\n--- 🎉 Všechny úlohy dokončeny ---")
 
 if __name__ == "__main__":
@@ -0,0 +1,202 @@
+"""
+Sdílené zdroje seznamů URL (Google Sheet, publikované CSV) s lokální cache.
+
+Poslední stažený snímek se drží v `{URL_SOURCE_CACHE_DIR}/{name}.json`
+spolu s validátorem (ETag / Last-Modified u CSV, `version` souboru
+z Drive API u sheetu). Nezměněný zdroj se znovu nestahuje ani neparsuje.
+
+Inkrementální režim vrací jen řádky, které ještě nebyly potvrzené
+jako zpracované (`commit(processed)`) — co selhalo, přijde znovu.
+
+    source = CsvUrlSource(CSV_URL, "instagram")
+    rows = source.rows(incremental=True)
+    ...
+    source.commit([row for row in rows if hotovo(row)])
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from urllib.parse import quote
+
+CACHE_DIR = os.environ.get("URL_SOURCE_CACHE_DIR", ".url_sources")
+TIMEOUT = (10, 60)
+
+SHEETS_VALUES_URL = "https://sheets.googleapis.com/v4/spreadsheets/{id}/values/{range}"
+DRIVE_FILE_URL = "https://www.googleapis.com/drive/v3/files/{id}"
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets.readonly",
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+
+
+def _row_key(row):
+    return json.dumps(row, ensure_ascii=False)
+
+
+def _trimmed(row):
+    """Řádek bez prázdných buněk na konci — records() je doplňuje podle hlavičky."""
+    row = list(row)
+    while row and not row[-1]:
+        row.pop()
+    return tuple(row)
+
+
+class UrlSource:
+    """Snímek zdroje v cache + rozdíl proti poslednímu potvrzenému běhu.
+
+    Potomci implementují `_fetch(validator)`: vrací `None`, když se zdroj
+    nezměnil, jinak `(řádky, nový validátor)`.
+    """
+
+    def __init__(self, name, header=False, cache_dir=CACHE_DIR):
+        self.name = name
+        self.has_header = header
+        self.path = Path(cache_dir) / f"{name}.json"
+        self.header = []
+        self._rows = []
+        self._state = {"validator": None, "rows": [], "seen": []}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self._state = json.load(f)
+        self.unchanged = False
+
+    def rows(self, incremental=False):
+        """Datové řádky zdroje (seznamy řetězců), bez hlavičky."""
+        fetched = self._fetch(self._state["validator"])
+        self.unchanged = fetched is None
+        if fetched is None:
+            rows = self._state["rows"]
+            print(f"♻️ Zdroj {self.name} se nezměnil — použit lokální snímek ({len(rows)} řádků).")
+        else:
+            rows, validator = fetched
+            self._state["rows"], self._state["validator"] = rows, validator
+            self._save()
+
+        if self.has_header and rows:
+            self.header, rows = rows[0], rows[1:]
+        rows = [r for r in rows if any(cell.strip() for cell in r)]
+        self._rows = rows
+        if incremental:
+            seen = set(self._state["seen"])
+            rows = [r for r in rows if _row_key(r) not in seen]
+            print(f"🆕 Zdroj {self.name}: {len(rows)} nových řádků od minulého běhu.")
+        return rows
+
+    def records(self, incremental=False):
+        """Řádky jako slovníky podle hlavičky (jako gspread get_all_records)."""
+        rows = self.rows(incremental)
+        return [dict(zip(self.header, r + [""] * (len(self.header) - len(r)))) for r in rows]
+
+    def commit(self, processed):
+        """Označí zpracované řádky pro příští inkrementální běh.
+
+        `processed` jsou řádky z rows() nebo slovníky z records(), které se
+        podařilo zpracovat. Dřív potvrzené řádky, které ve zdroji zůstaly,
+        zůstávají potvrzené; ostatní vrátí příští inkrementální běh znovu.
+        """
+        done = {_trimmed([r.get(h, "") for h in self.header] if isinstance(r, dict) else r)
+                for r in processed}
+        seen = set(self._state["seen"])
+        self._state["seen"] = [key for key, row in ((_row_key(r), r) for r in self._rows)
+                               if key in seen or _trimmed(row) in done]
+        self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _fetch(self, validator):
+        raise NotImplementedError
+
+
+class CsvUrlSource(UrlSource):
+    """Publikované CSV (např. Google Sheet → Publikovat na webu → CSV)."""
+
+    def __init__(self, url, name, header=False, session=None, cache_dir=CACHE_DIR):
+        super().__init__(name, header, cache_dir)
+        self.url = url
+        self.session = session
+
+    def _fetch(self, validator):
+        import requests
+
+        validator = validator or {}
+        headers = {}
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+
+        resp = (self.session or requests).get(self.url, headers=headers, timeout=TIMEOUT)
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+
+        # Publikovaná CSV ETag často neposílají — obsah se pak porovná hashem
+        digest = hashlib.sha256(resp.content).hexdigest()
+        if digest == validator.get("sha256"):
+            return None
+        text = resp.content.decode("utf-8-sig")
+        rows = list(csv.reader(io.StringIO(text)))
+        return rows, {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "sha256": digest,
+        }
+
+
+class SheetUrlSource(UrlSource):
+    """List Google Sheetu přes Sheets API; změnu pozná podle `version` z Drive API.
+
+    Pokud service account nemá k Drive API přístup, stahuje se pokaždé.
+    """
+
+    def __init__(self, credentials_file, spreadsheet_id, sheet_name, name=None, header=True,
+                 cache_dir=CACHE_DIR):
+        super().__init__(name or f"sheet-{spreadsheet_id}-{sheet_name}", header, cache_dir)
+        self.credentials_file = credentials_file
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+
+    def _session(self):
+        from google.auth.transport.requests import AuthorizedSession
+        from google.oauth2 import service_account
+
+        credentials = service_account.Credentials.from_service_account_file(
+            self.credentials_file, scopes=SCOPES
+        )
+        return AuthorizedSession(credentials)
+
+    def _revision(self, session):
+        resp = session.get(
+            DRIVE_FILE_URL.format(id=self.spreadsheet_id),
+            params={"fields": "version,modifiedTime", "supportsAllDrives": "true"},
+            timeout=TIMEOUT,
+        )
+        if not resp.ok:
+            print(f"⚠️ Revizi sheetu nelze zjistit (Drive API {resp.status_code}) — stahuji celý list.")
+            return None
+        return resp.json().get("version")
+
+    def _fetch(self, validator):
+        session = self._session()
+        revision = self._revision(session)
+        if revision and validator and validator.get("version") == revision:
+            return None
+
+        sheet_range = quote(f"'{self.sheet_name}'", safe="")
+        resp = session.get(
+            SHEETS_VALUES_URL.format(id=self.spreadsheet_id, range=sheet_range),
+            params={"valueRenderOption": "FORMATTED_VALUE"},
+            timeout=TIMEOUT,
+        )
+        resp.raise_for_status()
+        rows = [[str(cell) for cell in row] for row in resp.json().get("values", [])]
+        return rows, {"version": revision}
@@ -0,0 +1,129 @@
+"""
+Lokální SQLite úložiště aktivit ze Strava.
+
+Drží surové JSON odpovědi API (summary z /athlete/activities a detail
+z /activities/{id}) a číslo řádku aktivity v Google Sheets, které se
+na začátku každé synchronizace načte znovu ze sheetu. Diff, deduplikace i stavba řádků tak běží lokálně a nový
+sloupec v COLUMNS jde doplnit bez jediného volání Strava API.
+"""
+
+import json
+import sqlite3
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    id          INTEGER PRIMARY KEY,
+    start_date  TEXT,
+    summary     TEXT,
+    detail      TEXT,
+    sheet_row   INTEGER,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_activities_start_date ON activities(start_date);
+CREATE INDEX IF NOT EXISTS idx_activities_sheet_row  ON activities(sheet_row);
+"""
+
+
+def parse_start_date(value: str) -> int:
+    """Strava `start_date` (UTC, ISO 8601 se 'Z') → unix timestamp."""
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+class ActivityStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ── Zápis ────────────────────────────────────────────────────────────────
+
+    def upsert_summaries(self, activities: list[dict]):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                """INSERT INTO activities (id, start_date, summary, updated_at)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET
+                       start_date = excluded.start_date,
+                       summary    = excluded.summary,
+                       updated_at = excluded.updated_at""",
+                [(a["id"], a.get("start_date"), json.dumps(a), now) for a in activities],
+            )
+
+    def upsert_details(self, details: dict[int, dict]):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                """INSERT INTO activities (id, start_date, detail, updated_at)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET
+                       detail     = excluded.detail,
+                       start_date = COALESCE(activities.start_date, excluded.start_date),
+                       updated_at = excluded.updated_at""",
+                [(aid, d.get("start_date"), json.dumps(d), now) for aid, d in details.items()],
+            )
+
+    def delete(self, activity_ids: list[int]):
+        with self.conn:
+            self.conn.executemany("DELETE FROM activities WHERE id = ?", [(a,) for a in activity_ids])
+
+    def set_sheet_rows(self, rows: dict[int, int]):
+        """Uloží {id aktivity: číslo řádku v sheetu}."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE activities SET sheet_row = ? WHERE id = ?",
+                [(row, aid) for aid, row in rows.items()],
+            )
+
+    def clear_sheet_rows(self):
+        with self.conn:
+            self.conn.execute("UPDATE activities SET sheet_row = NULL")
+
+    # ── Čtení ────────────────────────────────────────────────────────────────
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0]
+
+    def latest_start_date(self) -> str | None:
+        row = self.conn.execute("SELECT MAX(start_date) FROM activities").fetchone()
+        return row[0]
+
+    def unsynced_ids(self) -> list[int]:
+        """Aktivity, které ještě nejsou v sheetu — od nejstarší."""
+        return [r[0] for r in self.conn.execute(
+            "SELECT id FROM activities WHERE sheet_row IS NULL ORDER BY start_date, id"
+        )]
+
+    def missing_detail_ids(self) -> list[int]:
+        """Aktivity bez detailu — od nejnovější, ty jsou v sheetu nejvíc vidět."""
+        return [r[0] for r in self.conn.execute(
+            "SELECT id FROM activities WHERE detail IS NULL ORDER BY start_date DESC, id DESC"
+        )]
+
+    def iter_merged(self):
+        """Vrací (id, sloučený dict) od nejstarší — viz _merge."""
+        cur = self.conn.execute(
+            "SELECT id, summary, detail FROM activities ORDER BY start_date, id"
+        )
+        for aid, summary, detail in cur:
+            yield aid, self._merge(summary, detail)
+
+    @staticmethod
+    def _merge(summary: str | None, detail: str | None) -> dict:
+        # Detail se stahuje jednou, summary při každém běhu — jeho hodnoty
+        # (kudos, přejmenování) jsou čerstvější, detail jen doplní zbytek.
+        act = json.loads(detail) if detail else {}
+        if summary:
+            act.update(json.loads(summary))
+        return act
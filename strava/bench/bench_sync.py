@@ -0,0 +1,122 @@
+"""
+Benchmark synchronizace Strava → Google Sheets proti lokálním náhradám.
+
+Pro každou velikost účtu spustí `stravaDownloader.main()` dvakrát proti
+fake Strava API (bench/fake_strava.py) a in-memory sheetu
+(bench/fake_worksheet.py):
+
+  cold — prázdná lokální DB i sheet (první běh / --full-resync)
+  warm — pár nových aktivit a pár upravených (typický plánovaný běh)
+
+a vypíše aktivity/s, počet volání API, 429 a požadavky na Sheets.
+Rate limit okno se dá zkrátit (--window), aby běh netrval 15 minut.
+
+Použití (z adresáře strava/):
+    python bench/bench_sync.py
+    python bench/bench_sync.py --sizes 100 1000 20000 --window 5 --error-rate 0.01
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import stravaDownloader as sd                       # noqa: E402
+from strava_client import StravaClient              # noqa: E402
+from fake_strava import FakeStrava                  # noqa: E402
+from fake_worksheet import FakeWorksheet            # noqa: E402
+
+
+def run_sync(fake: FakeStrava, ws: FakeWorksheet, verbose: bool, extra_args=()) -> dict:
+    calls0, throttled0 = fake.total_calls, fake.throttled
+    reads0, writes0, cells0 = ws.reads, ws.writes, ws.cells_written
+    argv, sys.argv = sys.argv, ["stravaDownloader.py", *extra_args]
+    out = sys.stdout if verbose else io.StringIO()
+    t0 = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            sd.main()
+    finally:
+        sys.argv = argv
+    return {
+        "seconds":   time.perf_counter() - t0,
+        "api_calls": fake.total_calls - calls0,
+        "throttled": fake.throttled - throttled0,
+        "reads":     ws.reads - reads0,
+        "writes":    ws.writes - writes0,
+        "cells":     ws.cells_written - cells0,
+    }
+
+
+def check_sheet(fake: FakeStrava, ws: FakeWorksheet) -> bool:
+    """Sheet obsahuje každou aktivitu právě jednou a s aktuálním kudos."""
+    kudos_col = sd.COLUMNS.index("kudos")
+    rows = {str(r[0]): r for r in ws.rows[1:] if r}
+    if len(rows) != len(ws.rows) - 1:
+        return False
+    return all(str(a["id"]) in rows and rows[str(a["id"])][kudos_col] == a["kudos_count"]
+               for a in fake.activities)
+
+
+def bench(size: int, args) -> dict:
+    fake = FakeStrava(size, limits=(args.limit_15min, args.limit_daily),
+                      read_limits=(args.limit_15min // 2, args.limit_daily // 2),
+                      window=args.window, error_rate=args.error_rate, latency=args.latency)
+    url = fake.start()
+    ws = FakeWorksheet()
+    with tempfile.TemporaryDirectory() as tmp:
+        token_file = Path(tmp) / "token.json"
+        token_file.write_text(json.dumps({"access_token": "fake", "refresh_token": "fake",
+                                          "expires_at": int(time.time()) + 6 * 3600}))
+        sd.API_BASE   = f"{url}/api/v3"
+        sd.TOKEN_URL  = f"{url}/oauth/token"
+        sd.TOKEN_FILE = str(token_file)
+        sd.DB_FILE    = str(Path(tmp) / "activities.db")
+        sd.open_sheet = lambda: ws
+        sd.strava_api = StravaClient(log=sd.log, rate_limit_min_wait=0)
+        extra = ["--tracks-dir", str(Path(tmp) / "tracks")] if args.tracks else []
+
+        cold = run_sync(fake, ws, args.verbose, extra)
+        fake.touch(args.warm_touched)
+        fake.add_activities(args.warm_new)
+        warm = run_sync(fake, ws, args.verbose, extra)
+        ok = check_sheet(fake, ws)
+    fake.stop()
+    return {"size": size, "cold": cold, "warm": warm, "ok": ok}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Strava → Sheets synchronizace")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--limit-15min", type=int, default=200, help="Celkový 15min limit (čtecí = polovina)")
+    parser.add_argument("--limit-daily", type=int, default=2000, help="Celkový denní limit (čtecí = polovina)")
+    parser.add_argument("--window", type=float, default=5, help="Délka 15min okna v sekundách (zkrácená)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Pravděpodobnost náhodné 429")
+    parser.add_argument("--latency", type=float, default=0.02, help="Latence fake API v sekundách")
+    parser.add_argument("--warm-new", type=int, default=3, help="Nové aktivity před druhým během")
+    parser.add_argument("--warm-touched", type=int, default=3, help="Upravené (nejnovější) aktivity před druhým během")
+    parser.add_argument("--tracks", action="store_true", help="Stahovat i GPS trasy")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Zobraz výstup skriptu")
+    args = parser.parse_args()
+
+    header = (f"{'aktivit':>8} │ {'cold s':>7} {'akt/s':>8} {'API':>5} {'429':>4} {'SH r/w':>7} {'buněk':>7} │ "
+              f"{'warm s':>7} {'API':>4} {'429':>4} {'SH r/w':>7} {'buněk':>6} │ ok")
+    print(header)
+    print("─" * len(header))
+    for size in args.sizes:
+        r = bench(size, args)
+        c, w = r["cold"], r["warm"]
+        print(f"{size:>8} │ {c['seconds']:>7.2f} {size / c['seconds']:>8.0f} {c['api_calls']:>5} "
+              f"{c['throttled']:>4} {c['reads']:>3}/{c['writes']:<3} {c['cells']:>7} │ "
+              f"{w['seconds']:>7.2f} {w['api_calls']:>4} {w['throttled']:>4} "
+              f"{w['reads']:>3}/{w['writes']:<3} {w['cells']:>6} │ {'✓' if r['ok'] else '✗'}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Lokální náhrada Strava API pro testy rychlosti a správnosti synchronizace.
+
+Servíruje stránkovaný seznam aktivit, detaily, streamy i statistiky atleta,
+posílá realistické hlavičky X-RateLimit-* / X-ReadRateLimit-* a umí vracet
+429 — po vyčerpání limitu nebo náhodně s danou pravděpodobností.
+
+Samostatně:
+    python bench/fake_strava.py --activities 2000 --port 8900
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TYPES = ["Run", "Ride", "Walk", "Hike", "Swim", "Workout"]
+
+
+def make_activity(activity_id: int, start: datetime, rng: random.Random) -> dict:
+    kind = rng.choice(TYPES)
+    gps  = kind not in ("Swim", "Workout")
+    distance = round(rng.uniform(2_000, 60_000), 1)
+    moving   = int(distance / rng.uniform(2.5, 8.0))
+    return {
+        "id":                   activity_id,
+        "name":                 f"{kind} #{activity_id}",
+        "type":                 kind,
+        "sport_type":           kind,
+        "start_date":           start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "start_date_local":     start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "distance":             distance,
+        "moving_time":          moving,
+        "elapsed_time":         moving + rng.randint(0, 900),
+        "total_elevation_gain": round(rng.uniform(0, 800), 1),
+        "elev_low":             round(rng.uniform(150, 300), 1),
+        "elev_high":            round(rng.uniform(300, 900), 1),
+        "average_speed":        round(distance / moving, 3),
+        "max_speed":            round(distance / moving * 1.8, 3),
+        "average_heartrate":    round(rng.uniform(110, 165), 1),
+        "max_heartrate":        float(rng.randint(160, 195)),
+        "kudos_count":          rng.randint(0, 30),
+        "workout_type":         rng.choice([None, 0, 1, 2, 3]),
+        "start_latlng":         [50.08, 14.42] if gps else [],
+        "map":                  {"summary_polyline": "abc" if gps else ""},
+    }
+
+
+class FakeStrava:
+    """Data a stav rate limitu; HTTP server nad nimi běží ve vlákně."""
+
+    def __init__(self, activities: int = 1000, limits=(200, 2000), read_limits=(100, 1000),
+                 window: float = 900, error_rate: float = 0.0, latency: float = 0.0, seed: int = 1):
+        self.rng          = random.Random(seed)
+        self.limits       = list(limits)
+        self.read_limits  = list(read_limits)
+        self.window       = window
+        self.error_rate   = error_rate
+        self.latency      = latency
+        self.lock         = threading.Lock()
+        self.calls: dict[str, int] = {}
+        self.throttled    = 0
+        self._usage       = [0, 0]
+        self._window_start = time.time()
+        self.activities: list[dict] = []   # od nejnovější
+        self._next_id = 10_000_000_000
+        self._now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.add_activities(activities)
+        self.server = None
+
+    # ── Data ─────────────────────────────────────────────────────────────────
+
+    def add_activities(self, count: int):
+        """Přidá `count` nových aktivit (novějších než všechny stávající)."""
+        new = []
+        for _ in range(count):
+            self._now += timedelta(hours=self.rng.uniform(6, 40))
+            self._next_id += self.rng.randint(1, 50)
+            new.append(make_activity(self._next_id, self._now, self.rng))
+        with self.lock:
+            self.activities[:0] = reversed(new)
+            self._by_id = {a["id"]: a for a in self.activities}
+
+    def touch(self, count: int):
+        """Změní kudos/název u nejnovějších aktivit — simulace pozdějších úprav
+        (kudos a přejmenování přicházejí v prvních dnech po nahrání)."""
+        with self.lock:
+            for act in self.activities[:count]:
+                act["kudos_count"] += 1
+                act["name"] += " ✓"
+
+    def detail(self, act: dict) -> dict:
+        rng = random.Random(act["id"])
+        return {**act, "calories": round(rng.uniform(100, 1500), 1),
+                "description": "", "device_name": "Fake Watch"}
+
+    def streams(self, act: dict) -> dict:
+        rng = random.Random(act["id"])
+        n = max(2, act["moving_time"] // 5)
+        lat, lng, points = 50.08, 14.42, []
+        for _ in range(n):
+            lat += rng.uniform(-1, 1) * 1e-4
+            lng += rng.uniform(-1, 1) * 1e-4
+            points.append([round(lat, 6), round(lng, 6)])
+        return {
+            "latlng":   {"data": points, "series_type": "distance"},
+            "time":     {"data": list(range(0, n * 5, 5)), "series_type": "distance"},
+            "altitude": {"data": [round(250 + rng.uniform(-5, 5), 1) for _ in range(n)]},
+        }
+
+    # ── Rate limit ───────────────────────────────────────────────────────────
+
+    def _count(self, kind: str) -> tuple[bool, dict]:
+        with self.lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            now = time.time()
+            if now - self._window_start >= self.window:
+                self._window_start = now
+                self._usage[0] = 0
+            self._usage = [u + 1 for u in self._usage]
+            reset = int(self._window_start + self.window)
+            headers = {
+                "X-RateLimit-Limit":     f"{self.limits[0]},{self.limits[1]}",
+                "X-RateLimit-Usage":     f"{self._usage[0]},{self._usage[1]}",
+                "X-ReadRateLimit-Limit": f"{self.read_limits[0]},{self.read_limits[1]}",
+                "X-ReadRateLimit-Usage": f"{self._usage[0]},{self._usage[1]}",
+                "X-RateLimit-Reset":     str(reset),
+            }
+            over = any(u > l for u, l in zip(self._usage, self.read_limits))
+            injected = self.rng.random() < self.error_rate
+            if over or injected:
+                self.throttled += 1
+                if injected and not over:
+                    headers["X-RateLimit-Reset"] = str(int(now) + 1)
+            return over or injected, headers
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    # ── HTTP ─────────────────────────────────────────────────────────────────
+
+    def handle(self, method: str, path: str, query: dict) -> tuple[int, dict | list]:
+        if method == "POST" and path == "/oauth/token":
+            return 200, {"access_token": "fake", "refresh_token": "fake",
+                         "expires_at": int(time.time()) + 6 * 3600, "scope": "activity:read_all"}
+        if path == "/api/v3/athlete":
+            return 200, {"id": 1, "firstname": "Fake"}
+        if path == "/api/v3/athletes/1/stats":
+            counts = {}
+            for act in self.activities:
+                counts[act["type"]] = counts.get(act["type"], 0) + 1
+            return 200, {"all_ride_totals": {"count": counts.get("Ride", 0)},
+                         "all_run_totals":  {"count": counts.get("Run", 0)},
+                         "all_swim_totals": {"count": counts.get("Swim", 0)}}
+        if path == "/api/v3/athlete/activities":
+            per_page = min(int(query.get("per_page", 30)), 200)
+            page     = int(query.get("page", 1))
+            acts     = self.activities
+            if "after" in query:
+                after = datetime.fromtimestamp(int(query["after"]), tz=timezone.utc)
+                acts = [a for a in acts if datetime.fromisoformat(
+                    a["start_date"].replace("Z", "+00:00")) > after]
+            return 200, acts[(page - 1) * per_page:page * per_page]
+        match = re.fullmatch(r"/api/v3/activities/(\d+)(/streams)?", path)
+        if match:
+            act = self._by_id.get(int(match.group(1)))
+            if not act:
+                return 404, {"message": "Record Not Found"}
+            return 200, self.streams(act) if match.group(2) else self.detail(act)
+        return 404, {"message": "Not Found"}
+
+    def start(self, port: int = 0) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self, method):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if method == "POST":
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                kind = re.sub(r"\d+", "{id}", url.path)
+                throttled, headers = fake._count(kind)
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if throttled:
+                    status, body = 429, {"message": "Rate Limit Exceeded"}
+                else:
+                    status, body = fake.handle(method, url.path, query)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Strava API")
+    parser.add_argument("--activities", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Pravděpodobnost náhodné 429")
+    args = parser.parse_args()
+
+    fake = FakeStrava(args.activities, error_rate=args.error_rate)
+    url = fake.start(args.port)
+    print(f"Fake Strava API běží na {url}/api/v3 ({len(fake.activities)} aktivit, "
+          f"{math.ceil(len(fake.activities) / 200)} stránek po 200). Ctrl+C ukončí.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+In-memory náhrada gspread Worksheet pro testy synchronizace.
+
+Podporuje jen metody, které volá stravaDownloader.py, a počítá čtecí
+a zapisovací požadavky tak, jak by je počítala kvóta Sheets API.
+Hodnoty zapsané přes USER_ENTERED se ukládají jako v Sheets — datum
+"YYYY-MM-DD" se převede na sériové číslo, číselné řetězce na čísla.
+"""
+
+import re
+from datetime import date
+
+SHEETS_EPOCH = date(1899, 12, 30)
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_A1_RE   = re.compile(r"^([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _user_entered(value):
+    if isinstance(value, str):
+        if _DATE_RE.match(value):
+            return (date.fromisoformat(value) - SHEETS_EPOCH).days
+        try:
+            number = float(value)
+            return int(number) if number.is_integer() else number
+        except ValueError:
+            return value
+    if value is None:
+        return ""
+    return value
+
+
+class FakeWorksheet:
+    def __init__(self, title: str = "Data-python"):
+        self.title  = title
+        self.rows: list[list] = []
+        self.reads  = 0
+        self.writes = 0
+        self.cells_written = 0
+
+    # ── Čtení ────────────────────────────────────────────────────────────────
+
+    def row_values(self, row: int) -> list:
+        self.reads += 1
+        return [str(v) for v in self.rows[row - 1]] if row <= len(self.rows) else []
+
+    def col_values(self, col: int) -> list:
+        self.reads += 1
+        return [r[col - 1] if col <= len(r) else "" for r in self.rows]
+
+    def get_values(self, range_name=None, **kwargs) -> list[list]:
+        self.reads += 1
+        return [list(r) for r in self.rows]
+
+    # ── Zápis ────────────────────────────────────────────────────────────────
+
+    def _write(self, a1: str, values: list[list], user_entered: bool):
+        match = _A1_RE.match(a1.split("!")[-1])
+        if not match:
+            raise ValueError(f"Nepodporovaný rozsah: {a1}")
+        col0, row0 = _col_index(match.group(1)), int(match.group(2))
+        for r, row in enumerate(values):
+            target = row0 + r
+            while len(self.rows) < target:
+                self.rows.append([])
+            cells = self.rows[target - 1]
+            for c, value in enumerate(row):
+                col = col0 + c
+                while len(cells) < col:
+                    cells.append("")
+                cells[col - 1] = _user_entered(value) if user_entered else value
+                self.cells_written += 1
+
+    def update(self, a, b=None, value_input_option="RAW", **kwargs):
+        # gspread < 6: update(range, values), gspread 6: update(values, range)
+        range_name, values = (a, b) if isinstance(a, str) else (b, a)
+        self.writes += 1
+        self._write(range_name or "A1", values, value_input_option == "USER_ENTERED")
+
+    def batch_update(self, data: list[dict], value_input_option="RAW", **kwargs):
+        self.writes += 1
+        for item in data:
+            self._write(item["range"], item["values"], value_input_option == "USER_ENTERED")
+        return {"totalUpdatedCells": sum(len(r) for d in data for r in d["values"])}
+
+    def append_rows(self, values: list[list], value_input_option="RAW", **kwargs):
+        self.writes += 1
+        first = len(self.rows) + 1
+        self._write(f"A{first}", values, value_input_option == "USER_ENTERED")
+        last = first + len(values) - 1
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:S{last}"}}
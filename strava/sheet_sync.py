@@ -0,0 +1,177 @@
+"""
+Diff-based synchronizace řádků do Google Sheets.
+
+Porovná aktuální obsah sheetu s řádky postavenými z lokálního úložiště a
+vytvoří co nejmenší sadu zápisů: změněné buňky se slučují do obdélníkových
+rozsahů pro `batch_update`, chybějící aktivity jdou jedním `append_rows`.
+Zápisy se posílají s ohledem na kvótu Sheets API (60 zápisů / min / uživatel).
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+WRITE_INTERVAL  = 1.1      # s mezi zápisy → pod 60 požadavků za minutu
+MAX_BATCH_CELLS = 40_000   # buněk na jeden batch_update (limit velikosti payloadu)
+GAP_FILL        = 2        # nezměněné buňky mezi změnami, které se přepíšou s nimi
+SHEETS_EPOCH    = date(1899, 12, 30)
+
+
+@dataclass
+class SyncPlan:
+    updates: list[dict] = field(default_factory=list)   # [{"range": "C5:F7", "values": [[...]]}]
+    appends: list[list] = field(default_factory=list)
+    changed_cells: int = 0
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.updates and not self.appends
+
+
+def col_letter(col: int) -> str:
+    """1 → A, 27 → AA."""
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+# Hodnota buňky v `desired`, kterou synchronizace nemá měnit — např. calories
+# aktivity, jejíž detail ještě není stažený (prázdné "" by smazalo vyplněnou buňku).
+KEEP = object()
+
+
+def read_sheet_rows(worksheet, width: int) -> dict[str, tuple[int, list]]:
+    """Načte sheet jedním požadavkem → {id: (číslo řádku, hodnoty)}.
+
+    Hodnoty jsou neformátované (čísla jako čísla, ne podle locale sheetu).
+    Při duplicitním ID platí první výskyt.
+    """
+    values = worksheet.get_values(value_render_option="UNFORMATTED_VALUE")
+    rows = {}
+    for number, row in enumerate(values[1:], start=2):
+        if not row or row[0] in ("", None):
+            continue
+        key = _id_key(row[0])
+        if key not in rows:
+            rows[key] = (number, (list(row) + [""] * width)[:width])
+    return rows
+
+
+def _id_key(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def normalize(value, is_date: bool = False):
+    """Sjednotí hodnotu z API a ze sheetu, aby šly porovnat."""
+    if value is None or value == "":
+        return ""
+    if isinstance(value, bool):
+        return str(value).upper()
+    if is_date and isinstance(value, (int, float)):
+        # USER_ENTERED převede "YYYY-MM-DD" na sériové číslo data
+        return (SHEETS_EPOCH + timedelta(days=int(value))).isoformat()
+    if isinstance(value, (int, float)):
+        return round(float(value), 6)
+    if isinstance(value, str):
+        try:
+            return round(float(value), 6)
+        except ValueError:
+            return value.strip()
+    return value
+
+
+def plan_sync(current: dict[str, tuple[int, list]], desired: dict, columns: list[str],
+              date_columns: tuple[str, ...] = ("date",)) -> SyncPlan:
+    """Spočítá minimální sadu zápisů, aby sheet odpovídal `desired` ({id: řádek}).
+
+    Buňky s hodnotou KEEP se neporovnávají; nové řádky je mají prázdné.
+    """
+    width = len(columns)
+    date_idx = {columns.index(c) for c in date_columns if c in columns}
+    plan = SyncPlan()
+
+    # 1) změněné úseky po řádcích: {číslo řádku: [(první sloupec, poslední sloupec)]}
+    spans: dict[int, list[tuple[int, int]]] = {}
+    values_by_row: dict[int, list] = {}
+    for key, row in desired.items():
+        key = _id_key(key)
+        if key not in current:
+            plan.appends.append(["" if v is KEEP else v for v in row])
+            continue
+        number, existing = current[key]
+        changed = [i for i in range(width) if row[i] is not KEEP
+                   and normalize(existing[i], i in date_idx) != normalize(row[i], i in date_idx)]
+        if not changed:
+            continue
+        plan.changed_cells += len(changed)
+        # KEEP uvnitř slučovaného úseku se přepíše stávající hodnotou
+        values_by_row[number] = [existing[i] if v is KEEP else v for i, v in enumerate(row)]
+        runs = [[changed[0], changed[0]]]
+        for i in changed[1:]:
+            if i - runs[-1][1] <= GAP_FILL + 1:
+                runs[-1][1] = i
+            else:
+                runs.append([i, i])
+        spans[number] = [tuple(r) for r in runs]
+
+    # 2) sousední řádky se stejnými úseky slouč do jednoho obdélníku
+    blocks: list[tuple[int, int, int, int]] = []   # (první řádek, poslední řádek, c0, c1)
+    open_blocks: dict[tuple[int, int], int] = {}   # úsek → index otevřeného bloku
+    for number in sorted(spans):
+        next_open = {}
+        for span in spans[number]:
+            idx = open_blocks.get(span)
+            if idx is not None and blocks[idx][1] == number - 1:
+                r0, _, c0, c1 = blocks[idx]
+                blocks[idx] = (r0, number, c0, c1)
+            else:
+                idx = len(blocks)
+                blocks.append((number, number, *span))
+            next_open[span] = idx
+        open_blocks = next_open
+
+    for r0, r1, c0, c1 in blocks:
+        plan.updates.append({
+            "range":  f"{col_letter(c0 + 1)}{r0}:{col_letter(c1 + 1)}{r1}",
+            "values": [values_by_row[r][c0:c1 + 1] for r in range(r0, r1 + 1)],
+        })
+    return plan
+
+
+def apply_plan(worksheet, plan: SyncPlan, log=print):
+    """Provede plán: batch_update změněných rozsahů, pak append_rows nových řádků."""
+    last_write = 0.0
+
+    def throttle():
+        nonlocal last_write
+        wait = last_write + WRITE_INTERVAL - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        last_write = time.time()
+
+    batch, cells = [], 0
+    batches = []
+    for update in plan.updates:
+        size = sum(len(r) for r in update["values"])
+        if batch and cells + size > MAX_BATCH_CELLS:
+            batches.append(batch)
+            batch, cells = [], 0
+        batch.append(update)
+        cells += size
+    if batch:
+        batches.append(batch)
+
+    for i, batch in enumerate(batches, 1):
+        throttle()
+        log(f"  batch_update {i}/{len(batches)}: {len(batch)} rozsahů")
+        worksheet.batch_update(batch, value_input_option="USER_ENTERED")
+
+    if not plan.appends:
+        return
+    throttle()
+    log(f"  append_rows: {len(plan.appends)} řádků")
+    worksheet.append_rows(plan.appends, value_input_option="USER_ENTERED")
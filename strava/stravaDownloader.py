@@ -1,15 +1,22 @@
 import os
 import sys
+import math
 import time
 import json
-import requests
+import argparse
+import threading
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
 from urllib.parse import urlparse, parse_qs, urlencode
 
-import gspread
-from google.oauth2.service_account import Credentials
+# gspread, google-auth a requests (strava_client) se importují až v cestách,
+# které je potřebují — `--help` ani import z benchmarku na ně nečekají.
+from activity_store import ActivityStore, parse_start_date
+from sheet_sync import KEEP, read_sheet_rows, plan_sync, apply_plan
+import track_export
 
 # ── Konfigurace ───────────────────────────────────────────────────────────────
 
@@ -17,6 +24,22 @@ CLIENT_ID         = os.environ.get("STRAVA_CLIENT_ID", "")
 CLIENT_SECRET     = os.environ.get("STRAVA_CLIENT_SECRET", "")
 TOKEN_FILE        = os.environ.get("STRAVA_TOKEN_FILE", ".strava_token.json")
 REFRESH_TOKEN_ENV = os.environ.get("STRAVA_REFRESH_TOKEN", "")
+DB_FILE           = os.environ.get("STRAVA_DB_FILE", ".strava_activities.db")
+
+# Aktivity nahrané se zpožděním (ruční upload, offline hodinky) mají start_date
+# starší než poslední synchronizovaná — proto se `after` posouvá o pár dní zpět.
+SYNC_OVERLAP_SECONDS = 7 * 24 * 3600
+
+# Detaily aktivit (calories) — souběžné stahování v rámci rate limitu
+DETAIL_WORKERS = int(os.environ.get("STRAVA_DETAIL_WORKERS", "4"))
+
+# Stránky seznamu aktivit — při stahování celé historie souběžně (1 = postupně)
+PAGE_WORKERS = int(os.environ.get("STRAVA_PAGE_WORKERS", "8"))
+PER_PAGE     = 200   # maximum Strava API
+
+# GPS trasy pro gpx-mapper — prázdné = nestahovat
+TRACKS_DIR    = os.environ.get("STRAVA_TRACKS_DIR", "")
+TRACKS_FORMAT = os.environ.get("STRAVA_TRACKS_FORMAT", "gpx")   # gpx nebo bin
 
 GOOGLE_CREDS   = os.environ.get("GOOGLE_CREDENTIALS_FILE", "google_credentials.json")
 SPREADSHEET_ID = "1MxnYvXjVUorTTe05UV-OxBV-LwZmSBMtXtwL8YFS6k8"
@@ -35,6 +58,9 @@ COLUMNS = [
     "total_elevation_gain", "pace", "average_speed", "max_speed", "workout_type",
 ]
 
+# Sloupce, které jsou jen v detailu aktivity — bez detailu se v sheetu nemění
+DETAIL_COLUMNS = ("calories",)
+
 # ── Logging ───────────────────────────────────────────────────────────────────
 
 def log(msg: str):
@@ -46,6 +72,9 @@ def log_section(title: str):
     log(title)
     print('─' * 50, flush=True)
 
+# Sdílený HTTP klient — vytváří ho main() (benchmark ho může podstrčit předem)
+strava_api = None
+
 # ── Token management ──────────────────────────────────────────────────────────
 
 def save_token(token: dict):
@@ -63,7 +92,7 @@ def load_token() -> dict | None:
 
 def refresh_token(token: dict) -> dict:
     log("Obnovuji Strava access token...")
-    resp = requests.post(TOKEN_URL, data={
+    resp = strava_api.post(TOKEN_URL, data={
         "client_id":     CLIENT_ID,
         "client_secret": CLIENT_SECRET,
         "grant_type":    "refresh_token",
@@ -117,7 +146,7 @@ class _CallbackHandler(BaseHTTPRequestHandler):
         pass
 
 def exchange_code(code: str) -> dict:
-    resp = requests.post(TOKEN_URL, data={
+    resp = strava_api.post(TOKEN_URL, data={
         "client_id":     CLIENT_ID,
         "client_secret": CLIENT_SECRET,
         "code":          code,
@@ -170,19 +199,10 @@ def oauth_flow() -> dict:
 
 # ── Strava API ────────────────────────────────────────────────────────────────
 
+
 def api_get(endpoint: str, token: dict, params: dict = None) -> dict | list:
     headers = {"Authorization": f"Bearer {token['access_token']}"}
-    resp = requests.get(f"{API_BASE}{endpoint}", headers=headers, params=params or {})
-    if resp.status_code == 429:
-        used  = resp.headers.get("X-RateLimit-Usage", "?")
-        limit = resp.headers.get("X-RateLimit-Limit", "?")
-        reset = int(resp.headers.get("X-RateLimit-Reset", time.time() + 900))
-        wait  = max(reset - int(time.time()), 60)
-        reset_str = datetime.fromtimestamp(reset, tz=timezone.utc).strftime("%H:%M:%S UTC")
-        log(f"Rate limit dosažen (usage: {used}/{limit}) — čekám {wait}s do {reset_str}...")
-        time.sleep(wait)
-        log("Rate limit vyprsel, pokracuji...")
-        return api_get(endpoint, token, params)
+    resp = strava_api.get(f"{API_BASE}{endpoint}", headers=headers, params=params or {})
     if resp.status_code == 403:
         raise RuntimeError(
             f"403 Forbidden na {endpoint}\n"
@@ -192,27 +212,200 @@ def api_get(endpoint: str, token: dict, params: dict = None) -> dict | list:
     resp.raise_for_status()
     return resp.json()
 
-def fetch_all_activities(token: dict) -> list[dict]:
+def fetch_all_activities(token: dict, after: int | None = None) -> list[dict]:
+    if after is None and PAGE_WORKERS > 1:
+        return fetch_all_activities_parallel(token, PAGE_WORKERS)
+
     activities = []
     page = 1
     t_start = time.time()
-    log("Zahajuji stahování aktivit ze Strava...")
+    params = {"per_page": PER_PAGE}
+    if after is not None:
+        params["after"] = after
+        after_str = datetime.fromtimestamp(after, tz=timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+        log(f"Zahajuji inkrementální stahování aktivit od {after_str}...")
+    else:
+        log("Zahajuji stahování aktivit ze Strava...")
     while True:
         t_page = time.time()
-        batch = api_get("/athlete/activities", token, {"per_page": 100, "page": page})
+        batch = api_get("/athlete/activities", token, {**params, "page": page})
         if not batch:
             break
         activities.extend(batch)
         elapsed = time.time() - t_start
         log(f"  Stránka {page}: +{len(batch)} aktivit → celkem {len(activities)} ({elapsed:.1f}s)")
+        if len(batch) < params["per_page"]:
+            break
         page += 1
         time.sleep(0.4)
     log(f"Stahování dokončeno: {len(activities)} aktivit za {time.time() - t_start:.1f}s")
     return activities
 
+def estimate_activity_pages(token: dict) -> int:
+    """Odhad počtu stránek z /athletes/{id}/stats.
+
+    Statistiky počítají jen jízdy, běhy a plavání, takže jde o dolní odhad —
+    zbytek dotáhne spekulativní stahování dalších stránek.
+    """
+    try:
+        athlete = api_get("/athlete", token)
+        stats   = api_get(f"/athletes/{athlete['id']}/stats", token)
+    except Exception as e:
+        log(f"Statistiky atleta nedostupné ({e}) — odhaduji 1 stránku.")
+        return 1
+    known = sum(stats.get(key, {}).get("count", 0)
+                for key in ("all_ride_totals", "all_run_totals", "all_swim_totals"))
+    log(f"Podle statistik má atlet alespoň {known} aktivit.")
+    return max(1, math.ceil(known / PER_PAGE))
+
+def fetch_all_activities_parallel(token: dict, workers: int) -> list[dict]:
+    """Stáhne celou historii souběžnými požadavky na stránky.
+
+    Nejdřív se stáhnou všechny odhadnuté stránky, pak po vlnách `workers`
+    dalších, dokud nepřijde neúplná stránka. Výsledek je ve stejném pořadí
+    jako při postupném stahování (od nejnovější), bez duplicit.
+    """
+    t_start = time.time()
+    log("Zahajuji souběžné stahování celé historie aktivit...")
+    pages: dict[int, list] = {}
+
+    def fetch_page(page: int) -> tuple[int, list | None]:
+        if not strava_api.budget.acquire():
+            return page, None
+        return page, api_get("/athlete/activities", token, {"per_page": PER_PAGE, "page": page})
+
+    wave_end = estimate_activity_pages(token)
+    next_page, last_page = 1, None
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while last_page is None:
+            # Nevyčerpej rate limit — vlna nanejvýš tak velká, kolik zbývá
+            room = max(strava_api.budget.remaining(), 1)
+            wave = range(next_page, min(wave_end, next_page + room - 1) + 1)
+            for page, batch in ex.map(fetch_page, wave):
+                if batch is None:
+                    # Limit vyčerpaný — stránka postupně, klient při 429 počká na reset okna
+                    log(f"  Stránka {page}: rate limit vyčerpán, stahuji postupně...")
+                    batch = api_get("/athlete/activities", token, {"per_page": PER_PAGE, "page": page})
+                pages[page] = batch
+            log(f"  Stránky {wave.start}–{wave.stop - 1}: celkem "
+                f"{sum(len(b) for b in pages.values())} aktivit ({time.time() - t_start:.1f}s)")
+            for page in wave:
+                if len(pages[page]) < PER_PAGE:
+                    last_page = page
+                    break
+            next_page = wave.stop
+            wave_end = next_page + workers - 1
+
+    activities, seen = [], set()
+    for page in range(1, last_page + 1):
+        for act in pages[page]:
+            # Nová aktivita během stahování posune stránky — duplicity zahoď
+            if act["id"] not in seen:
+                seen.add(act["id"])
+                activities.append(act)
+    log(f"Stahování dokončeno: {len(activities)} aktivit z {last_page} stránek "
+        f"za {time.time() - t_start:.1f}s")
+    return activities
+
 def fetch_detail(token: dict, activity_id: int) -> dict:
     return api_get(f"/activities/{activity_id}", token)
 
+def fetch_details(token: dict, activity_ids: list[int]) -> tuple[dict[int, dict], list[int]]:
+    """Souběžně stáhne detaily aktivit, dokud to dovolí rate limit.
+
+    Vrací (detaily podle ID, ID odložená na další běh). Aktivity, které
+    Strava už nezná (404), nejsou ani v jednom z výsledků.
+    """
+    details: dict[int, dict] = {}
+    deferred: list[int] = []
+    lock = threading.Lock()
+    done = 0
+
+    import requests
+
+    def worker(activity_id: int):
+        nonlocal done
+        if not strava_api.budget.acquire():
+            with lock:
+                deferred.append(activity_id)
+            return
+        try:
+            detail = fetch_detail(token, activity_id)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                log(f"  Detail {activity_id}: aktivita neexistuje, přeskakuji.")
+            else:
+                log(f"  Detail {activity_id} selhal: {e} — zkusím příště.")
+                with lock:
+                    deferred.append(activity_id)
+            return
+        except Exception as e:
+            log(f"  Detail {activity_id} selhal: {e} — zkusím příště.")
+            with lock:
+                deferred.append(activity_id)
+            return
+        with lock:
+            details[activity_id] = detail
+            done += 1
+            log(f"  Detail {done}/{len(activity_ids)}: {detail.get('name', activity_id)}")
+
+    log(f"Stahuji detaily pro {len(activity_ids)} aktivit (calories), "
+        f"volná kapacita API: {strava_api.budget.remaining()} požadavků...")
+    with ThreadPoolExecutor(max_workers=DETAIL_WORKERS) as ex:
+        list(ex.map(worker, activity_ids))
+
+    if deferred:
+        log(f"Rate limit: {len(deferred)} detailů odloženo na další běh.")
+    # Zachovej pořadí vstupu (nové aktivity první)
+    order = {aid: i for i, aid in enumerate(activity_ids)}
+    return details, sorted(deferred, key=order.__getitem__)
+
+def fetch_tracks(token: dict, activities: list[dict], directory: Path, fmt: str) -> tuple[int, int]:
+    """Souběžně stáhne GPS streamy a uloží je jako trasy pro gpx-mapper.
+
+    Stahují se jen aktivity s GPS, které ve složce ještě nemají soubor —
+    co se nevejde do rate limitu, dotáhne se v dalším běhu.
+    Vrací (uloženo, odloženo).
+    """
+    have = track_export.existing_track_ids(directory)
+    todo = [a for a in activities if a["id"] not in have and track_export.has_gps(a)]
+    if not todo:
+        log(f"Trasy v {directory} jsou kompletní.")
+        return 0, 0
+
+    lock = threading.Lock()
+    saved = deferred = 0
+
+    def worker(act: dict):
+        nonlocal saved, deferred
+        if not strava_api.budget.acquire():
+            with lock:
+                deferred += 1
+            return
+        try:
+            streams = api_get(f"/activities/{act['id']}/streams", token,
+                              {"keys": track_export.STREAM_KEYS, "key_by_type": "true"})
+            path = track_export.write_track(directory, act, streams, fmt)
+        except Exception as e:
+            log(f"  Trasa {act['id']} selhala: {e} — zkusím příště.")
+            with lock:
+                deferred += 1
+            return
+        if path:
+            with lock:
+                saved += 1
+                log(f"  Trasa {saved}/{len(todo)}: {path.name}")
+        else:
+            log(f"  Trasa {act['id']}: stream bez GPS bodů, příště se přeskočí.")
+
+    log(f"Stahuji GPS trasy pro {len(todo)} aktivit do {directory} ({fmt}), "
+        f"volná kapacita API: {strava_api.budget.remaining()} požadavků...")
+    with ThreadPoolExecutor(max_workers=DETAIL_WORKERS) as ex:
+        list(ex.map(worker, todo))
+    if deferred:
+        log(f"Rate limit: {deferred} tras odloženo na další běh.")
+    return saved, deferred
+
 # ── Transformace ──────────────────────────────────────────────────────────────
 
 def activity_to_row(act: dict) -> list:
@@ -242,6 +435,9 @@ def activity_to_row(act: dict) -> list:
 # ── Google Sheets ─────────────────────────────────────────────────────────────
 
 def open_sheet():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     if not os.path.exists(GOOGLE_CREDS):
         raise FileNotFoundError(
             f"Soubor s Google credentials nebyl nalezen: {GOOGLE_CREDS}\n"
@@ -265,27 +461,30 @@ def open_sheet():
             log(f"Google Sheets nedostupné: {e} — čekám {wait}s (pokus {attempt}/5)...")
             time.sleep(wait)
 
-def get_existing_ids(worksheet) -> set:
-    log("Načítám existující ID z Google Sheets...")
-    all_ids = worksheet.col_values(1)
-    ids = set(str(v) for v in all_ids[1:] if v)
-    log(f"Nalezeno {len(ids)} existujících záznamů v sheetu.")
-    return ids
-
 def ensure_header(worksheet):
     first_row = worksheet.row_values(1)
     if first_row != COLUMNS:
         worksheet.update("A1", [COLUMNS])
         log("Hlavička doplněna.")
 
-def append_rows(worksheet, rows: list[list]):
-    if not rows:
-        return
-    worksheet.append_rows(rows, value_input_option="USER_ENTERED")
-
 # ── Main ──────────────────────────────────────────────────────────────────────
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Strava → Google Sheets sync")
+    parser.add_argument("--full-resync", action="store_true",
+                        help="Stáhni celou historii aktivit místo jen nových")
+    parser.add_argument("--tracks-dir", type=Path, default=Path(TRACKS_DIR) if TRACKS_DIR else None,
+                        help="Složka pro GPS trasy pro gpx-mapper (např. ../gpx-mapper/maps)")
+    parser.add_argument("--tracks-format", choices=sorted(track_export.FORMATS), default=TRACKS_FORMAT,
+                        help="gpx = GPX soubory, bin = kompaktní binární .trk (výchozí: gpx)")
+    return parser.parse_args()
+
 def main():
+    global strava_api
+    args = parse_args()
+    if strava_api is None:
+        from strava_client import StravaClient
+        strava_api = StravaClient(log=log)
     t_total = time.time()
     print("=" * 50)
     log("START: Strava → Google Sheets")
@@ -302,37 +501,65 @@ def main():
     token = get_valid_token()
 
     log_section("3/4  Strava — stahování aktivit")
-    activities = fetch_all_activities(token)
-
-    log_section("4/4  Google Sheets — zápis nových aktivit")
-    existing_ids   = get_existing_ids(worksheet)
-    new_activities = [act for act in activities if str(act.get("id", "")) not in existing_ids]
-    log(f"Nových aktivit k zapsání: {len(new_activities)}")
-
-    if not new_activities:
-        log("Žádné nové aktivity — sheet je aktuální.")
+    store = ActivityStore(DB_FILE)
+    log(f"Lokální úložiště {DB_FILE}: {store.count()} aktivit.")
+    last_synced = store.latest_start_date()
+    if args.full_resync:
+        log("--full-resync: stahuji celou historii.")
+        activities = fetch_all_activities(token)
+    elif last_synced:
+        log(f"Poslední synchronizovaná aktivita: {last_synced}")
+        activities = fetch_all_activities(token, after=parse_start_date(last_synced) - SYNC_OVERLAP_SECONDS)
     else:
-        DETAIL_THRESHOLD = 20
-        if len(new_activities) <= DETAIL_THRESHOLD:
-            log(f"Stahuji detaily pro {len(new_activities)} aktivit (calories)...")
-            enriched = []
-            for i, act in enumerate(new_activities, 1):
-                detail = fetch_detail(token, act["id"])
-                enriched.append(activity_to_row(detail))
-                log(f"  Detail {i}/{len(new_activities)}: {act.get('name', act['id'])}")
-                time.sleep(0.3)
-        else:
-            log(f"Hromadný import ({len(new_activities)} aktivit) — calories přeskočeny.")
-            enriched = [activity_to_row(act) for act in new_activities]
-
-        chunk = 500
-        for i in range(0, len(enriched), chunk):
-            batch = enriched[i:i + chunk]
-            log(f"Zapisuji řádky {i+1}–{i+len(batch)} do Google Sheets...")
-            append_rows(worksheet, batch)
-            log(f"  Dávka zapsána.")
-
-        log(f"Zapsáno {len(enriched)} nových řádků do záložky '{SHEET_NAME}'.")
+        log("Lokální úložiště je prázdné — stahuji celou historii.")
+        activities = fetch_all_activities(token)
+    store.upsert_summaries(activities)
+
+    log_section("4/4  Google Sheets — synchronizace řádků")
+    log("Načítám aktuální obsah sheetu...")
+    current = read_sheet_rows(worksheet, len(COLUMNS))
+    log(f"V sheetu je {len(current)} aktivit.")
+    store.clear_sheet_rows()
+    store.set_sheet_rows({int(aid): row for aid, (row, _) in current.items() if aid.isdigit()})
+
+    new_ids = store.unsynced_ids()
+    log(f"Nových aktivit k zapsání: {len(new_ids)}")
+
+    # Fronta detailů: nejdřív nové aktivity, pak starší bez detailu
+    new_set = set(new_ids)
+    queue = new_ids + [aid for aid in store.missing_detail_ids() if aid not in new_set]
+    details, deferred = fetch_details(token, queue) if queue else ({}, [])
+    store.upsert_details(details)
+    gone = set(queue) - set(details) - set(deferred)
+    if gone:
+        store.delete(list(gone))
+
+    without_detail = set(store.missing_detail_ids())
+    detail_idx = [COLUMNS.index(c) for c in DETAIL_COLUMNS]
+    desired = {}
+    for aid, act in store.iter_merged():
+        row = activity_to_row(act)
+        if aid in without_detail:
+            for i in detail_idx:
+                row[i] = KEEP
+        desired[aid] = row
+    plan = plan_sync(current, desired, COLUMNS)
+    if plan.is_empty:
+        log("Žádné změny — sheet je aktuální.")
+    else:
+        log(f"Změněných buněk: {plan.changed_cells} v {len(plan.updates)} rozsazích, "
+            f"nových řádků: {len(plan.appends)}.")
+        apply_plan(worksheet, plan, log=log)
+        log(f"Záložka '{SHEET_NAME}' synchronizována.")
+
+    if args.tracks_dir:
+        log_section("GPS trasy pro gpx-mapper")
+        # Od nejnovějších — ty chybí v mapě nejvíc
+        newest_first = [act for _, act in store.iter_merged()][::-1]
+        fetch_tracks(token, newest_first, args.tracks_dir, args.tracks_format)
+
+    log(f"Lokální úložiště: {store.count()} aktivit, odložených detailů: {len(deferred)}.")
+    store.close()
 
     print("\n" + "=" * 50)
     log(f"HOTOVO — celkový čas: {time.time() - t_total:.1f}s")
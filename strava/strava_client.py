@@ -0,0 +1,142 @@
+"""
+Sdílený HTTP klient pro Strava API.
+
+Jedna `requests.Session` s poolem spojení (žádný TLS handshake na každý
+request), gzip, timeouty a omezený počet opakování s backoffem pro 429
+a 5xx. Zároveň sleduje rate limit Stravy z hlaviček odpovědí.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = (10, 60)   # (connect, read) v sekundách
+MAX_RETRIES     = 5
+BACKOFF_BASE    = 2          # 2, 4, 8, 16… s pro 5xx a chyby spojení
+BACKOFF_MAX     = 120
+POOL_SIZE       = 16
+RATE_LIMIT_MIN_WAIT = 60     # s — nejkratší čekání po 429
+RATE_LIMIT_RESERVE = 10      # požadavků nechaných volných v každém okně (15 min / den)
+
+
+class RateLimitBudget:
+    """Zbývající kapacita Strava API podle hlaviček X-RateLimit-* / X-ReadRateLimit-*.
+
+    Obě hlavičky mají tvar "<15min>,<denní>". Hodnoty ze serveru se přebírají
+    z každé odpovědi, mezi odpověďmi se spotřeba počítá lokálně.
+    """
+
+    def __init__(self, reserve: int = RATE_LIMIT_RESERVE):
+        self._lock   = threading.Lock()
+        self.reserve = reserve
+        self.limit   = [200, 2000]
+        self.usage   = [0, 0]
+
+    @staticmethod
+    def _parse(value: str | None) -> list[int] | None:
+        try:
+            return [int(v) for v in value.split(",")[:2]]
+        except (AttributeError, ValueError):
+            return None
+
+    def update(self, headers):
+        windows = []
+        for prefix in ("X-RateLimit", "X-ReadRateLimit"):
+            limit = self._parse(headers.get(f"{prefix}-Limit"))
+            usage = self._parse(headers.get(f"{prefix}-Usage"))
+            if limit and usage:
+                windows.append((min(l - u for l, u in zip(limit, usage)), limit, usage))
+        if not windows:
+            return
+        # Čtecí limit bývá přísnější — drž se toho, kde zbývá méně
+        _, limit, usage = min(windows)
+        with self._lock:
+            self.limit, self.usage = limit, usage
+
+    def _left(self) -> int:
+        return min(l - u for l, u in zip(self.limit, self.usage)) - self.reserve
+
+    def remaining(self) -> int:
+        with self._lock:
+            return max(self._left(), 0)
+
+    def acquire(self) -> bool:
+        """Zarezervuje jeden požadavek; False pokud by překročil limit."""
+        with self._lock:
+            if self._left() < 1:
+                return False
+            self.usage = [u + 1 for u in self.usage]
+            return True
+
+
+class StravaClient:
+    def __init__(self, log=print, max_retries: int = MAX_RETRIES,
+                 timeout=DEFAULT_TIMEOUT, pool_size: int = POOL_SIZE,
+                 rate_limit_min_wait: int = RATE_LIMIT_MIN_WAIT):
+        self.log         = log
+        self.max_retries = max_retries
+        self.timeout     = timeout
+        self.rate_limit_min_wait = rate_limit_min_wait
+        self.budget      = RateLimitBudget()
+        self.session     = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Pošle request; 429, 5xx a chyby spojení opakuje (nejvýš max_retries×).
+
+        Vrací poslední odpověď — o ostatních stavových kódech rozhoduje volající.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(1, self.max_retries + 2):
+            last_attempt = attempt > self.max_retries
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    raise
+                wait = self._backoff(attempt)
+                self.log(f"Chyba spojení ({e.__class__.__name__}) — čekám {wait}s "
+                         f"(pokus {attempt}/{self.max_retries})...")
+                time.sleep(wait)
+                continue
+
+            self.budget.update(resp.headers)
+            if last_attempt:
+                return resp
+            if resp.status_code == 429:
+                self._wait_for_rate_limit(resp)
+                continue
+            if resp.status_code >= 500:
+                wait = self._backoff(attempt)
+                self.log(f"Strava vrátila {resp.status_code} — čekám {wait}s "
+                         f"(pokus {attempt}/{self.max_retries})...")
+                time.sleep(wait)
+                continue
+            return resp
+
+    @staticmethod
+    def _backoff(attempt: int) -> int:
+        return min(BACKOFF_BASE ** attempt, BACKOFF_MAX)
+
+    def _wait_for_rate_limit(self, resp: requests.Response):
+        used  = resp.headers.get("X-RateLimit-Usage", "?")
+        limit = resp.headers.get("X-RateLimit-Limit", "?")
+        # Strava okna se nulují po čtvrthodinách — bez hlavičky čekej na další
+        reset = int(resp.headers.get("X-RateLimit-Reset", 0)) or (int(time.time()) // 900 + 1) * 900
+        wait  = max(reset - int(time.time()), self.rate_limit_min_wait)
+        reset_str = datetime.fromtimestamp(reset, tz=timezone.utc).strftime("%H:%M:%S UTC")
+        self.log(f"Rate limit dosažen (usage: {used}/{limit}) — čekám {wait}s do {reset_str}...")
+        time.sleep(wait)
+        self.log("Rate limit vyprsel, pokracuji...")
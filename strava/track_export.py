@@ -0,0 +1,126 @@
+"""
+Export GPS streamů aktivit pro gpx-mapper.
+
+Soubory se jmenují `{id}-{typ}.gpx` / `{id}-{typ}.trk`, takže je
+`detect_color` v gpx_map.py obarví podle typu aktivity. Aktivita, jejíž
+stream nemá žádné body (GPS jen v summary), dostane prázdný `{id}.nogps`,
+aby se stream nestahoval při každém běhu znovu.
+
+Binární formát .trk (little-endian):
+    magic   4 B   b"GTRK"
+    verze   u8    1
+    flagy   u8    bit 0 = time, bit 1 = altitude
+    počet   u32   N bodů
+    lat     N × i32   stupně × 1e7
+    lng     N × i32   stupně × 1e7
+    time    N × u32   sekundy od startu      (jen s flagem time)
+    alt     N × f32   metry                  (jen s flagem altitude)
+"""
+
+import os
+import re
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+TRK_MAGIC    = b"GTRK"
+TRK_VERSION  = 1
+FLAG_TIME    = 1
+FLAG_ALT     = 2
+STREAM_KEYS  = "latlng,time,altitude"
+FORMATS      = {"gpx": ".gpx", "bin": ".trk"}
+NO_GPS       = ".nogps"
+
+_ID_RE = re.compile(r"^(\d+)(?:[-_.])")
+
+
+def existing_track_ids(directory: Path) -> set[int]:
+    """ID aktivit, které už ve složce mají trasu (i ručně přidané `{id}.gpx`) nebo značku bez GPS."""
+    if not directory.exists():
+        return set()
+    ids = set()
+    for path in directory.iterdir():
+        if path.suffix in FORMATS.values() or path.suffix == NO_GPS:
+            match = _ID_RE.match(path.name)
+            if match:
+                ids.add(int(match.group(1)))
+    return ids
+
+
+def has_gps(act: dict) -> bool:
+    return bool(act.get("start_latlng")) or bool((act.get("map") or {}).get("summary_polyline"))
+
+
+def track_filename(act: dict, fmt: str) -> str:
+    kind = act.get("type") or act.get("sport_type") or "Activity"
+    return f"{act['id']}-{kind}{FORMATS[fmt]}"
+
+
+def write_track(directory: Path, act: dict, streams: dict, fmt: str) -> Path | None:
+    """Zapíše trasu z odpovědi /activities/{id}/streams?key_by_type=true.
+
+    Bez bodů vrací None a zapíše jen značku `{id}.nogps`.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    latlng = (streams.get("latlng") or {}).get("data") or []
+    if not latlng:
+        (directory / f"{act['id']}{NO_GPS}").touch()
+        return None
+    times = (streams.get("time") or {}).get("data")
+    alts  = (streams.get("altitude") or {}).get("data")
+
+    path = directory / track_filename(act, fmt)
+    tmp  = path.with_suffix(path.suffix + ".tmp")
+    if fmt == "bin":
+        tmp.write_bytes(encode_trk(latlng, times, alts))
+    else:
+        tmp.write_text(encode_gpx(act, latlng, times, alts), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+
+def encode_trk(latlng: list, times: list | None, alts: list | None) -> bytes:
+    n = len(latlng)
+    flags = (FLAG_TIME if times and len(times) == n else 0) | (FLAG_ALT if alts and len(alts) == n else 0)
+    parts = [
+        TRK_MAGIC + struct.pack("<BBI", TRK_VERSION, flags, n),
+        array("i", (round(p[0] * 1e7) for p in latlng)),
+        array("i", (round(p[1] * 1e7) for p in latlng)),
+    ]
+    if flags & FLAG_TIME:
+        parts.append(array("I", (int(t) for t in times)))
+    if flags & FLAG_ALT:
+        parts.append(array("f", (float(a) for a in alts)))
+    out = bytearray(parts[0])
+    for arr in parts[1:]:
+        if sys.byteorder == "big":
+            arr.byteswap()
+        out += arr.tobytes()
+    return bytes(out)
+
+
+def encode_gpx(act: dict, latlng: list, times: list | None, alts: list | None) -> str:
+    start = None
+    if times and act.get("start_date"):
+        start = datetime.fromisoformat(act["start_date"].replace("Z", "+00:00"))
+    name = escape(str(act.get("name", act["id"])))
+    kind = escape(str(act.get("type") or act.get("sport_type") or ""))
+
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<gpx version="1.1" creator="stravaDownloader" xmlns="http://www.topografix.com/GPX/1/1">',
+        f"  <trk><name>{name}</name><type>{kind}</type><trkseg>",
+    ]
+    for i, (lat, lng) in enumerate(latlng):
+        inner = ""
+        if alts and i < len(alts):
+            inner += f"<ele>{alts[i]}</ele>"
+        if start and i < len(times):
+            inner += f"<time>{(start + timedelta(seconds=times[i])).strftime('%Y-%m-%dT%H:%M:%SZ')}</time>"
+        lines.append(f'    <trkpt lat="{lat}" lon="{lng}">{inner}</trkpt>')
+    lines.append("  </trkseg></trk>")
+    lines.append("</gpx>")
+    return "\n".join(lines) + "\n"